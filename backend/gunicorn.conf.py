@@ -0,0 +1,27 @@
+"""
+gunicorn settings for running the backend with several worker processes:
+
+    cd backend && gunicorn -c gunicorn.conf.py server:app
+
+Workers default to one per core (WEB_CONCURRENCY overrides). Point CACHE_URL and RATE_LIMIT_STORE_URL
+at the same Redis-compatible server so workers share cached auth/profile lookups, cache invalidations,
+Idempotency-Key results and rate-limit buckets; without them every worker caches and throttles on its
+own, and a retried request that lands on another worker is executed again. Set FORWARDED_ALLOW_IPS to the
+ingress addresses: client IPs (and IP-keyed rate limits for anonymous requests) depend on it.
+
+Background loops (change feed, price feed) run in every worker. Profit accrual is off here unless
+ACCRUAL_INTERVAL is set explicitly, so workers do not each scan every investment; trigger it from one
+place instead (POST /api/admin/accrual/run, a cron, or a separate single-worker instance).
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = 5
+timeout = 60
+graceful_timeout = 30
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+raw_env = [] if "ACCRUAL_INTERVAL" in os.environ else ["ACCRUAL_INTERVAL=0"]
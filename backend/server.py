@@ -1,15 +1,37 @@
+import asyncio
+import base64
+import bisect
+import csv
+import hashlib
+import hmac
+import importlib.util
+import io
+import ipaddress
+import json
+import math
 import os
+import random
+import secrets
+import time
 import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
-
-from fastapi import FastAPI, HTTPException, Body, Header
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+from enum import Enum
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, EmailStr
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, PlainSerializer
 from dotenv import load_dotenv
 
+from storage import Keyset, MemoryStorage, MongoStorage, Storage, SupabaseStorage
+
 # IMPORTANT:
-# - Bind handled by supervisor to 0.0.0.0:8001
+# - Bind handled by supervisor to 0.0.0.0:8001 (multi-worker: see gunicorn.conf.py)
 # - All routes MUST be prefixed with '/api'
 
 # Load env
@@ -22,7 +44,37 @@ SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY")
 REST_BASE = f"{SUPABASE_URL}/rest/v1" if SUPABASE_URL else None
 AUTH_BASE = f"{SUPABASE_URL}/auth/v1" if SUPABASE_URL else None
 
-app = FastAPI(title="CryptoBoost Backend", openapi_url="/api/openapi.json", docs_url="/api/docs")
+# orjson is optional: it backs the default response class and cached/exported payloads when installed
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    orjson = None
+    DefaultJSONResponse = JSONResponse
+
+
+def json_bytes(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, separators=(",", ":"), default=str).encode()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await on_startup()  # see "Lifecycle" below
+    try:
+        yield
+    finally:
+        await on_shutdown()
+
+
+app = FastAPI(
+    title="CryptoBoost Backend",
+    lifespan=lifespan,
+    openapi_url="/api/openapi.json",
+    docs_url="/api/docs",
+    default_response_class=DefaultJSONResponse,
+)
 
 # CORS
 frontend_origin = os.environ.get("FRONTEND_ORIGIN")
@@ -33,23 +85,128 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Idempotent-Replayed"],
 )
 
-# Optional Mongo (kept for platform contract, not used in Supabase flow)
-mongo_client = None
-roles_collection = None
-users_collection = None
-if MONGO_URL:
-    try:
-        from motor.motor_asyncio import AsyncIOMotorClient
-        mongo_client = AsyncIOMotorClient(MONGO_URL)
-        db_name = os.environ.get("MONGO_DB", "cryptoboost")
-        db = mongo_client[db_name]
-        roles_collection = db["roles"]
-        users_collection = db["users"]
-    except Exception:
-        roles_collection = None
-        users_collection = None
+
+# Metrics (Prometheus text format on /api/metrics; plain dict counters, no client library)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound below which a fraction `q` of observations fall."""
+        target, seen = q * self.total(), 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.requests: Dict[Tuple[str, str, int], int] = {}  # (method, route, status)
+        self.request_latency: Dict[Tuple[str, str], Histogram] = {}  # (method, route)
+        self.upstream_calls: Dict[Tuple[str, str, str], int] = {}  # (target, method, status)
+        self.upstream_latency: Dict[Tuple[str, str], Histogram] = {}  # (target, method)
+        self.gauges: List[Callable[[], List[Tuple[str, Dict[str, str], float]]]] = []
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        hist = self.request_latency.get((method, route))
+        if hist is None:
+            hist = self.request_latency[(method, route)] = Histogram()
+        hist.observe(seconds)
+
+    def observe_upstream(self, target: str, method: str, status: str, seconds: float) -> None:
+        key = (target, method, status)
+        self.upstream_calls[key] = self.upstream_calls.get(key, 0) + 1
+        hist = self.upstream_latency.get((target, method))
+        if hist is None:
+            hist = self.upstream_latency[(target, method)] = Histogram()
+        hist.observe(seconds)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def labels(**kv: Any) -> str:
+            return ",".join(f'{k}="{v}"' for k, v in kv.items())
+
+        def histogram(name: str, help_text: str, series: Dict[Tuple[str, str], Histogram], keys: Tuple[str, str]) -> None:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} histogram"])
+            for key, hist in sorted(series.items()):
+                base = labels(**dict(zip(keys, key)))
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), hist.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{base},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{base}}} {hist.sum:.6f}")
+                lines.append(f"{name}_count{{{base}}} {cumulative}")
+
+        lines.extend(["# HELP http_requests_total HTTP requests by route and status", "# TYPE http_requests_total counter"])
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{{{labels(method=method, route=route, status=status)}}} {count}")
+        histogram("http_request_duration_seconds", "HTTP request latency", self.request_latency, ("method", "route"))
+        lines.extend(["# HELP supabase_requests_total Upstream Supabase calls by target and status", "# TYPE supabase_requests_total counter"])
+        for (target, method, status), count in sorted(self.upstream_calls.items()):
+            lines.append(f"supabase_requests_total{{{labels(target=target, method=method, status=status)}}} {count}")
+        histogram("supabase_request_duration_seconds", "Upstream Supabase call latency", self.upstream_latency, ("target", "method"))
+        samples: Dict[str, List[str]] = {}
+        for collect in self.gauges:
+            for name, kv, value in collect():
+                samples.setdefault(name, []).append(f"{name}{{{labels(**kv)}}} {value}")
+        for name, rows in samples.items():
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.extend(rows)
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware task overhead) timing each request by route template."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe_request(scope["method"], route, status, time.perf_counter() - started)
+
+
+app.add_middleware(MetricsMiddleware)
 
 
 def uuid4_str() -> str:
@@ -77,11 +234,169 @@ class LoginRequest(BaseModel):
     password: str
 
 
+# -------- Domain models (mirror investment_plans, user_investments, transactions) --------
+# Amounts are validated as Decimal against the column precision and emitted as JSON numbers.
+Money = Annotated[Decimal, Field(max_digits=15, decimal_places=2), PlainSerializer(float, return_type=float, when_used="json")]
+CryptoAmount = Annotated[Decimal, Field(max_digits=15, decimal_places=8), PlainSerializer(float, return_type=float, when_used="json")]
+Percent = Annotated[Decimal, Field(max_digits=5, decimal_places=2), PlainSerializer(float, return_type=float, when_used="json")]
+
+
+class TransactionType(str, Enum):
+    deposit = "deposit"
+    withdrawal = "withdrawal"
+
+
+class TransactionStatus(str, Enum):
+    pending = "pending"
+    approved = "approved"
+    rejected = "rejected"
+    failed = "failed"
+
+
+class InvestmentStatus(str, Enum):
+    active = "active"
+    completed = "completed"
+    cancelled = "cancelled"
+
+
+class PlanCreate(BaseModel):
+    name: str = Field(min_length=1)
+    description: Optional[str] = None
+    min_amount: Money = Field(ge=0)
+    max_amount: Optional[Money] = Field(default=None, ge=0)
+    profit_target: Percent = Field(ge=0)
+    duration_days: int = Field(gt=0)
+    features: Optional[List[str]] = None
+    is_active: bool = True
+
+
+class Plan(PlanCreate):
+    model_config = ConfigDict(extra="allow")
+
+    id: uuid.UUID
+    created_at: Optional[datetime] = None
+
+
+class InvestmentCreate(BaseModel):
+    plan_id: uuid.UUID
+    amount: Money = Field(gt=0)
+
+
+class Investment(InvestmentCreate):
+    model_config = ConfigDict(extra="allow")
+
+    id: uuid.UUID
+    user_id: uuid.UUID
+    profit_target: Optional[Money] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    current_profit: Optional[Money] = None
+    status: InvestmentStatus = InvestmentStatus.active
+    created_at: Optional[datetime] = None
+
+
+class TransactionCreate(BaseModel):
+    type: TransactionType
+    crypto_type: str = Field(min_length=1, max_length=16)
+    amount: CryptoAmount = Field(gt=0)
+    usd_value: Optional[Money] = Field(None, ge=0)  # priced server-side when PRICE_SOURCE is set
+    wallet_address: Optional[str] = None
+    transaction_hash: Optional[str] = None
+
+
+class Transaction(TransactionCreate):
+    model_config = ConfigDict(extra="allow")
+
+    id: uuid.UUID
+    user_id: uuid.UUID
+    fee_amount: Optional[CryptoAmount] = None
+    status: TransactionStatus = TransactionStatus.pending
+    admin_note: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class ReviewDecision(str, Enum):
+    approved = "approved"
+    rejected = "rejected"
+
+
+class TransactionDecision(BaseModel):
+    ids: List[uuid.UUID] = Field(min_length=1)
+    decision: ReviewDecision
+    admin_note: Optional[str] = Field(None, max_length=1000)
+
+
+def to_row(model: BaseModel, **extra: Any) -> Dict[str, Any]:
+    """JSON-ready dict for a PostgREST insert, leaving out unset optional columns."""
+    return {**model.model_dump(mode="json", exclude_none=True), **extra}
+
+
 # -------- Supabase helpers --------
 import httpx
 
-_role_cache: Dict[str, str] = {}  # name->id
-_role_rev_cache: Dict[str, str] = {}  # id->name
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.environ.get(name)
+    return float(raw) if raw else default
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.environ.get(name)
+    return int(raw) if raw else default
+
+
+# One pooled client per process, shared by every Supabase call (keep-alive + HTTP/2 when h2 is installed)
+SUPABASE_HTTP2 = os.environ.get("SUPABASE_HTTP2", "1") != "0"
+SUPABASE_POOL_LIMITS = httpx.Limits(
+    max_connections=_env_int("SUPABASE_POOL_MAX_CONNECTIONS", 100),
+    max_keepalive_connections=_env_int("SUPABASE_POOL_MAX_KEEPALIVE", 20),
+    keepalive_expiry=_env_float("SUPABASE_POOL_KEEPALIVE_EXPIRY", 30.0),
+)
+# Timeout per endpoint class: GoTrue auth calls, PostgREST reads, PostgREST writes
+SUPABASE_TIMEOUTS: Dict[str, httpx.Timeout] = {
+    "auth": httpx.Timeout(_env_float("SUPABASE_TIMEOUT_AUTH", 20.0), connect=5.0),
+    "read": httpx.Timeout(_env_float("SUPABASE_TIMEOUT_READ", 15.0), connect=5.0),
+    "write": httpx.Timeout(_env_float("SUPABASE_TIMEOUT_WRITE", 15.0), connect=5.0),
+}
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=SUPABASE_HTTP2 and _http2_available(),
+            limits=SUPABASE_POOL_LIMITS,
+            timeout=SUPABASE_TIMEOUTS["read"],
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def upstream_target(url: str) -> str:
+    """Metrics label for a Supabase URL: `auth/<endpoint>` or the PostgREST table / rpc name."""
+    path = url.split("?", 1)[0]
+    for prefix, label in (("/auth/v1/", "auth/"), ("/rest/v1/", "")):
+        _, sep, rest = path.partition(prefix)
+        if sep:
+            return label + rest
+    return "other"
 
 
 def sb_headers(bearer: Optional[str] = None, json: bool = True) -> Dict[str, str]:
@@ -96,60 +411,770 @@ def sb_headers(bearer: Optional[str] = None, json: bool = True) -> Dict[str, str
     return h
 
 
-async def load_roles_cache() -> None:
-    global _role_cache, _role_rev_cache
-    if not (REST_BASE and SUPABASE_ANON_KEY):
-        return
-    if _role_cache and _role_rev_cache:
-        return
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(f"{REST_BASE}/roles?select=*", headers=sb_headers())
-        r.raise_for_status()
-        for row in r.json():
-            _role_cache[row["name"]] = row["id"]
-            _role_rev_cache[row["id"]] = row["name"]
+# -------- Upstream resilience --------
+# Per-upstream (auth / rest) circuit breakers fail fast with 503 + Retry-After while Supabase is
+# unhealthy; GETs get jittered retries and optional hedging, both paid from a shared retry budget.
+SUPABASE_RETRIES = _env_int("SUPABASE_RETRIES", 2)
+SUPABASE_RETRY_BACKOFF = _env_float("SUPABASE_RETRY_BACKOFF", 0.05)
+SUPABASE_HEDGING = os.environ.get("SUPABASE_HEDGING", "1") != "0"
+SUPABASE_HEDGE_DELAY = _env_float("SUPABASE_HEDGE_DELAY", 0.25)  # until enough samples for a p95
+RETRYABLE_STATUSES = {502, 503, 504}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probe_inflight = False
+
+    def before_call(self) -> None:
+        if self.state == "closed":
+            return
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_inflight:
+            self._probe_inflight = True  # let exactly one trial call through
+            return
+        self.rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail=f"Upstream {self.name} unavailable",
+            headers={"Retry-After": str(max(1, math.ceil(remaining)))},
+        )
+
+    def release(self) -> None:
+        self._probe_inflight = False
+
+    def record(self, ok: bool) -> None:
+        self._probe_inflight = False
+        if ok:
+            self.state = "closed"
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips, "rejected": self.rejected}
+
+
+class RetryBudget:
+    """Each request earns `ratio` tokens (capped); each retry or hedge spends one."""
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.spent += 1
+        return True
+
+
+breakers = {
+    name: CircuitBreaker(
+        name,
+        failure_threshold=_env_int("BREAKER_FAILURE_THRESHOLD", 5),
+        reset_timeout=_env_float("BREAKER_RESET_TIMEOUT", 30.0),
+    )
+    for name in ("auth", "rest")
+}
+retry_budget = RetryBudget(ratio=_env_float("RETRY_BUDGET_RATIO", 0.2), max_tokens=_env_float("RETRY_BUDGET_MAX", 20.0))
+hedges_sent = 0
+
+# Admission control: bound concurrent upstream calls process-wide; queueing longer than
+# UPSTREAM_QUEUE_TIMEOUT sheds the request with a 503 instead of piling up workers.
+UPSTREAM_QUEUE_TIMEOUT = _env_float("UPSTREAM_QUEUE_TIMEOUT", 5.0)
+UPSTREAM_MAX_CONCURRENCY = _env_int("UPSTREAM_MAX_CONCURRENCY", 64)
+upstream_slots = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)  # replaced per lifespan, see on_startup
+upstream_shed = 0
+
+
+def _is_failure(r: httpx.Response) -> bool:
+    return r.status_code >= 500
+
+
+def hedge_delay(target: str) -> float:
+    hist = metrics.upstream_latency.get((target, "GET"))
+    if hist is None or hist.total() < 20:
+        return SUPABASE_HEDGE_DELAY
+    return hist.quantile(0.95)
+
+
+async def _send_once(breaker: CircuitBreaker, method: str, url: str, kind: str, **kwargs: Any) -> httpx.Response:
+    global upstream_shed
+    try:
+        await asyncio.wait_for(upstream_slots.acquire(), UPSTREAM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        upstream_shed += 1
+        raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+    try:
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            r = await http_client().request(method, url, timeout=SUPABASE_TIMEOUTS[kind], **kwargs)
+        except asyncio.CancelledError:
+            breaker.release()  # a cancelled hedge loser says nothing about upstream health
+            raise
+        except Exception:
+            breaker.record(False)
+            metrics.observe_upstream(upstream_target(url), method, "error", time.perf_counter() - started)
+            raise
+    finally:
+        upstream_slots.release()
+    breaker.record(not _is_failure(r))
+    metrics.observe_upstream(upstream_target(url), method, str(r.status_code), time.perf_counter() - started)
+    return r
+
+
+async def _send_hedged(breaker: CircuitBreaker, method: str, url: str, kind: str, **kwargs: Any) -> httpx.Response:
+    global hedges_sent
+    first = asyncio.ensure_future(_send_once(breaker, method, url, kind, **kwargs))
+    done, _ = await asyncio.wait({first}, timeout=hedge_delay(upstream_target(url)))
+    if done or breaker.state != "closed" or not retry_budget.withdraw():
+        return await first
+    hedges_sent += 1
+    second = asyncio.ensure_future(_send_once(breaker, method, url, kind, **kwargs))
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.exception():
+                    return task.result()
+        return await first  # both failed: surface the original error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def sb_request(method: str, url: str, kind: str = "read", hedge: bool = False, **kwargs: Any) -> httpx.Response:
+    """Call Supabase through the shared pool with breaker, retries (GET only) and optional hedging."""
+    breaker = breakers["auth" if AUTH_BASE and url.startswith(AUTH_BASE) else "rest"]
+    retry_budget.deposit()
+    idempotent = method == "GET"
+    attempt = 0
+    while True:
+        error: Optional[httpx.TransportError] = None
+        try:
+            if hedge and idempotent and SUPABASE_HEDGING:
+                r = await _send_hedged(breaker, method, url, kind, **kwargs)
+            else:
+                r = await _send_once(breaker, method, url, kind, **kwargs)
+            if not (idempotent and r.status_code in RETRYABLE_STATUSES):
+                return r
+        except httpx.TransportError as e:
+            if not idempotent:
+                raise
+            error = e
+        if attempt >= SUPABASE_RETRIES or breaker.state == "open" or not retry_budget.withdraw():
+            if error is not None:
+                raise error
+            return r
+        attempt += 1
+        await asyncio.sleep(random.uniform(0, SUPABASE_RETRY_BACKOFF * 2**attempt))  # full jitter
+
+
+# -------- Storage backends --------
+# Storage, its engines and the PostgREST filter parser live in storage.py; this picks and wires one.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+
+
+def make_storage(backend: str) -> Storage:
+    if backend == "supabase":
+        return SupabaseStorage(REST_BASE, SUPABASE_ANON_KEY, sb_request, sb_headers)
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "mongo":
+        if not MONGO_URL:
+            raise RuntimeError("STORAGE_BACKEND=mongo requires MONGO_URL")
+        return MongoStorage(MONGO_URL, os.environ.get("MONGO_DB", "cryptoboost"))
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+storage = make_storage(STORAGE_BACKEND)
+
+
+# -------- Background tasks --------
+async def cancel_task(task: Optional["asyncio.Future[Any]"]) -> None:
+    """Cancel a background task and wait until it has unwound."""
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+class PeriodicTask:
+    """Runs `fn` every `interval` seconds in the background. A failing run goes to `on_error` (its owner
+    already counts failures in its stats) and the loop carries on with the next one."""
+
+    def __init__(self, fn: Callable[[], Awaitable[Any]], on_error: Optional[Callable[[Exception], None]] = None):
+        self.fn = fn
+        self.on_error = on_error
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def _run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.fn()
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+
+    def start(self, interval: float) -> None:
+        if self._task is None and interval > 0:
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self) -> None:
+        await cancel_task(self._task)
+        self._task = None
+
+
+# -------- In-process caches --------
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after a per-entry TTL (seconds)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Any) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key onto one in-flight task."""
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Any, "asyncio.Future[Any]"] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        else:
+            self.coalesced += 1
+        # shield so a cancelled caller does not cancel the lookup other callers wait on
+        return await asyncio.shield(task)
+
+
+class TableSnapshot:
+    """Small reference table kept in memory: loaded once under a lock, then refreshed in the background."""
+
+    def __init__(self, table: str, refresh_interval: float):
+        self.table = table
+        self.refresh_interval = refresh_interval
+        self.rows: List[Dict[str, Any]] = []
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+        # failures are counted by refresh(); the previous snapshot keeps being served
+        self._refresher = PeriodicTask(self.refresh)
+
+    def _index(self, rows: List[Dict[str, Any]]) -> None:
+        pass
+
+    def age(self) -> Optional[float]:
+        return None if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    async def ensure_loaded(self) -> None:
+        if self.loaded_at is None:
+            await self.refresh(max_age=None)
+
+    async def refresh(self, max_age: Optional[float] = 0.0) -> None:
+        """Fetch the table unless a load newer than `max_age` seconds already happened (None: any load counts)."""
+        if not storage.configured:
+            return
+        async with self._lock:
+            age = self.age()
+            if age is not None and (max_age is None or age < max_age):
+                return
+            try:
+                rows = await storage.select(self.table, hedge=True)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            self.rows = rows
+            self._index(rows)
+            self.loaded_at = time.monotonic()
+            self.refreshes += 1
+            self.last_error = None
+
+    def start(self) -> None:
+        if not self._refresher.running:
+            self._lock = asyncio.Lock()
+        self._refresher.start(self.refresh_interval)
+
+    async def stop(self) -> None:
+        await self._refresher.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self.rows),
+            "age_seconds": self.age(),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class RoleRegistry(TableSnapshot):
+    def __init__(self, refresh_interval: float):
+        super().__init__("roles", refresh_interval)
+        self.by_name: Dict[str, str] = {}  # name->id
+        self.by_id: Dict[str, str] = {}  # id->name
+
+    def _index(self, rows: List[Dict[str, Any]]) -> None:
+        self.by_name = {row["name"]: row["id"] for row in rows}
+        self.by_id = {row["id"]: row["name"] for row in rows}
+
+    def id_for(self, name: str) -> Optional[str]:
+        return self.by_name.get(name)
+
+    def name_for(self, role_id: Optional[str], default: str = "client") -> str:
+        return self.by_id.get(role_id, default) if role_id else default
+
+
+class PlanCatalog(TableSnapshot):
+    """investment_plans indexed by id, so investment rows are hydrated locally instead of via an embedded join."""
+
+    def __init__(self, refresh_interval: float, miss_max_age: float):
+        super().__init__("investment_plans", refresh_interval)
+        self.miss_max_age = miss_max_age
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+
+    def _index(self, rows: List[Dict[str, Any]]) -> None:
+        self.by_id = {str(row["id"]): row for row in rows}
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        """Apply rows returned by an insert without waiting for the next refresh."""
+        self.by_id.update({str(row["id"]): row for row in rows})
+        self.rows = list(self.by_id.values())
+
+    async def ensure_plans(self, rows: List[Dict[str, Any]]) -> None:
+        if any(row.get("plan_id") and str(row["plan_id"]) not in self.by_id for row in rows):
+            try:
+                await self.refresh(max_age=self.miss_max_age)  # a plan created elsewhere since the last load
+            except Exception:
+                pass
+
+    def get(self, plan_id: Any) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(str(plan_id)) if plan_id else None
+
+    async def hydrate(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add `plan` {name} plus progress_pct / days_remaining to investment rows, in place."""
+        await self.ensure_plans(rows)
+        now = datetime.now(timezone.utc)
+        for row in rows:
+            plan = self.get(row.get("plan_id"))
+            if "plan_id" in row:
+                row["plan"] = {"name": plan["name"]} if plan else None
+            row.update(investment_progress(row, plan, now))
+        return rows
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def plan_profit_target(plan: Dict[str, Any], amount: Any) -> Decimal:
+    """What an investment of `amount` in `plan` pays over its term: the plan's profit_target percent, in cents."""
+    return (Decimal(str(amount)) * Decimal(str(plan["profit_target"])) / 100).quantize(CENT, rounding=ROUND_DOWN)
+
+
+def investment_progress(row: Dict[str, Any], plan: Optional[Dict[str, Any]], now: datetime) -> Dict[str, Any]:
+    """Elapsed share of the term and whole days left; the term ends at end_date, else start + plan duration_days."""
+    if row.get("status") == "completed":
+        return {"progress_pct": 100.0, "days_remaining": 0}
+    try:
+        start = _parse_ts(row.get("start_date"))
+        end = _parse_ts(row.get("end_date"))
+    except ValueError:
+        return {}
+    if end is None and start is not None and plan and plan.get("duration_days"):
+        end = start + timedelta(days=int(plan["duration_days"]))
+    if start is None or end is None:
+        return {}
+    term = (end - start).total_seconds()
+    elapsed = (now - start).total_seconds()
+    progress = 1.0 if term <= 0 else min(max(elapsed / term, 0.0), 1.0)
+    return {
+        "progress_pct": round(progress * 100, 2),
+        "days_remaining": max(0, math.ceil((end - now).total_seconds() / 86400)),
+    }
+
+
+role_registry = RoleRegistry(refresh_interval=_env_float("ROLES_REFRESH_INTERVAL", 300.0))
+plan_catalog = PlanCatalog(
+    refresh_interval=_env_float("PLANS_REFRESH_INTERVAL", 300.0),
+    miss_max_age=_env_float("PLANS_MISS_REFRESH_AGE", 5.0),
+)
+
+
+# -------- Shared cache tier --------
+# Each worker process has its own caches. With CACHE_URL (redis://..., any Redis-compatible server)
+# the auth and profile caches become two-tier: a short-lived in-process L1 (CACHE_L1_TTL) in front
+# of a shared L2, so adding workers does not multiply GoTrue/PostgREST lookups. Invalidations are
+# applied locally and broadcast on CACHE_CHANNEL to the other workers. If the server is unreachable
+# the caches fall back to L1 only; a missed broadcast is bounded by CACHE_L1_TTL.
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+CACHE_URL = os.environ.get("CACHE_URL")
+CACHE_L1_TTL = _env_float("CACHE_L1_TTL", 5.0)
+CACHE_CHANNEL = os.environ.get("CACHE_CHANNEL", "cryptoboost:invalidate")
+WORKER_ID = uuid4_str()
+
+
+def redis_from_url(url: str) -> Any:
+    """redis.asyncio client; the package is only imported once a redis URL is actually configured."""
+    import redis.asyncio as aioredis
+
+    return aioredis.from_url(url)
+
+
+class SharedCache:
+    """L2 key/value store plus the invalidation channel; every method is a no-op without CACHE_URL."""
+
+    def __init__(self, url: Optional[str], channel: str):
+        if url and not REDIS_AVAILABLE:
+            raise RuntimeError("CACHE_URL requires the redis package")
+        self.channel = channel
+        self._redis = redis_from_url(url) if url else None
+        self._handlers: Dict[str, Callable[[Any], None]] = {}
+        self._pending: Set["asyncio.Task[None]"] = set()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    @property
+    def configured(self) -> bool:
+        return self._redis is not None
+
+    async def get(self, key: str) -> Any:
+        try:
+            raw = await self._redis.get(key)
+        except Exception:
+            self.errors += 1
+            return None
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            await self._redis.set(key, json_bytes(value), px=max(1, int(ttl * 1000)))
+        except Exception:
+            self.errors += 1
+
+    async def claim(self, key: str, value: Any, ttl: float) -> Optional[bool]:
+        """SET NX: True if `key` was free and is now ours, False if taken, None if the store is unreachable."""
+        try:
+            return bool(await self._redis.set(key, json_bytes(value), px=max(1, int(ttl * 1000)), nx=True))
+        except Exception:
+            self.errors += 1
+            return None
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self._redis.delete(key)
+        except Exception:
+            self.errors += 1
+
+    def on(self, event: str, handler: Callable[[Any], None]) -> None:
+        self._handlers[event] = handler
+
+    def publish(self, event: str, arg: Any = None, keys: Iterable[str] = (), prefix: Optional[str] = None) -> None:
+        """Run `event`'s handler here now; drop the L2 `keys` (or everything under `prefix`) and notify other workers."""
+        self._handlers[event](arg)
+        if self._redis is None:
+            return
+        task = asyncio.ensure_future(self._broadcast(event, arg, list(keys), prefix))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _broadcast(self, event: str, arg: Any, keys: List[str], prefix: Optional[str]) -> None:
+        try:
+            if prefix is not None:
+                keys += [key async for key in self._redis.scan_iter(match=f"{prefix}*", count=1000)]
+            if keys:
+                await self._redis.delete(*keys)
+            await self._redis.publish(self.channel, json_bytes({"origin": WORKER_ID, "event": event, "arg": arg}))
+            self.published += 1
+        except Exception:
+            self.errors += 1
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    handler = self._handlers.get(data.get("event"))
+                    if data.get("origin") != WORKER_ID and handler is not None:
+                        self.received += 1
+                        handler(data.get("arg"))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+                await asyncio.sleep(1.0)  # reconnect; L1 entries expire within CACHE_L1_TTL meanwhile
+            finally:
+                await pubsub.aclose()
+
+    def start(self) -> None:
+        if self._task is None and self._redis is not None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        await cancel_task(self._task)
+        self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "worker": WORKER_ID,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+shared_cache = SharedCache(CACHE_URL, CACHE_CHANNEL)
+
+
+class TwoTierCache:
+    """TTLCache (L1) in front of the shared tier (L2). Values must be JSON-serializable."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float, shared: SharedCache):
+        self.name = name
+        self.l1 = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = shared
+        self.l2_hits = 0
+        self.l2_misses = 0
+        shared.on(f"cache:{name}", self._drop)
+
+    def _key(self, key: Any) -> str:
+        return f"cache:{self.name}:{key}"
+
+    async def get(self, key: Any) -> Any:
+        value = self.l1.get(key)
+        if value is not None or not self.shared.configured:
+            return value
+        value = await self.shared.get(self._key(key))
+        if value is None:
+            self.l2_misses += 1
+            return None
+        self.l2_hits += 1
+        self.l1.set(key, value, ttl=CACHE_L1_TTL)
+        return value
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.l1.ttl if ttl is None else ttl
+        if not self.shared.configured:
+            self.l1.set(key, value, ttl=ttl)
+            return
+        self.l1.set(key, value, ttl=min(ttl, CACHE_L1_TTL))
+        if ttl > 0:
+            await self.shared.set(self._key(key), value, ttl)
+
+    def _drop(self, key: Any) -> None:
+        if key is None:
+            self.l1.clear()
+        else:
+            self.l1.pop(key)
+
+    def invalidate(self, key: Any = None) -> None:
+        """Drop `key` (None: every entry) from this worker, the shared tier and every other worker's L1."""
+        if key is None:
+            self.shared.publish(f"cache:{self.name}", None, prefix=self._key(""))
+        else:
+            self.shared.publish(f"cache:{self.name}", key, keys=[self._key(key)])
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.l1.stats(), "l2_hits": self.l2_hits, "l2_misses": self.l2_misses}
+
+
+# Verified tokens are cached until their `exp` (capped), rejected ones briefly.
+# With SUPABASE_JWT_SECRET set, HS256 tokens are verified locally and never hit GoTrue.
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+AUTH_CACHE_MAX_TTL = _env_float("AUTH_CACHE_MAX_TTL", 60.0)
+AUTH_CACHE_NEGATIVE_TTL = _env_float("AUTH_CACHE_NEGATIVE_TTL", 5.0)
+auth_cache = TwoTierCache("auth", maxsize=_env_int("AUTH_CACHE_SIZE", 10000), ttl=AUTH_CACHE_MAX_TTL, shared=shared_cache)
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def jwt_claims(access_token: str, secret: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Decode a JWT payload; when `secret` is given, only return it if the HS256 signature matches."""
+    try:
+        header_b64, payload_b64, signature_b64 = access_token.split(".")
+        if secret is not None:
+            header = json.loads(_b64url_decode(header_b64))
+            if header.get("alg") != "HS256":
+                return None
+            expected = hmac.new(secret.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64url_decode(signature_b64)):
+                return None
+        claims = json.loads(_b64url_decode(payload_b64))
+    except ValueError:
+        return None
+    return claims if isinstance(claims, dict) else None
+
+
+def token_cache_key(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def _token_ttl(claims: Optional[Dict[str, Any]]) -> float:
+    exp = (claims or {}).get("exp")
+    if not isinstance(exp, (int, float)):
+        return AUTH_CACHE_MAX_TTL
+    return min(AUTH_CACHE_MAX_TTL, exp - time.time())
 
 
 async def get_auth_user(access_token: str) -> Dict[str, Any]:
+    key = token_cache_key(access_token)
+    cached = await auth_cache.get(key)
+    if cached is not None:
+        if not cached:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        return cached
+
+    if SUPABASE_JWT_SECRET:
+        claims = jwt_claims(access_token, secret=SUPABASE_JWT_SECRET)
+        if claims is None or not claims.get("sub") or _token_ttl(claims) <= 0:
+            await auth_cache.set(key, {}, ttl=AUTH_CACHE_NEGATIVE_TTL)
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        user = {"id": claims["sub"], "email": claims.get("email"), "role": claims.get("role")}
+        await auth_cache.set(key, user, ttl=_token_ttl(claims))
+        return user
+
     if not (AUTH_BASE and SUPABASE_ANON_KEY):
         raise HTTPException(status_code=500, detail="Supabase not configured")
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(f"{AUTH_BASE}/user", headers=sb_headers(bearer=access_token, json=False))
-        if r.status_code == 401:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        r.raise_for_status()
-        return r.json()
+    r = await sb_request("GET", f"{AUTH_BASE}/user", kind="auth", headers=sb_headers(bearer=access_token, json=False))
+    if r.status_code == 401:
+        await auth_cache.set(key, {}, ttl=AUTH_CACHE_NEGATIVE_TTL)
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    r.raise_for_status()
+    user = r.json()
+    await auth_cache.set(key, user, ttl=_token_ttl(jwt_claims(access_token)))
+    return user
+
+
+# (profile, role_name) per user id; concurrent lookups for one token share a single upstream round trip
+profile_cache = TwoTierCache(
+    "profile", maxsize=_env_int("PROFILE_CACHE_SIZE", 10000), ttl=_env_float("PROFILE_CACHE_TTL", 30.0), shared=shared_cache
+)
+profile_flight = SingleFlight()
+
+
+def invalidate_user_profile(user_id: Optional[str] = None) -> None:
+    profile_cache.invalidate(user_id)
 
 
 async def get_user_profile_with_role(access_token: str) -> Tuple[Dict[str, Any], str]:
-    await load_roles_cache()
+    return await profile_flight.do(token_cache_key(access_token), lambda: _resolve_user_profile(access_token))
+
+
+async def _resolve_user_profile(access_token: str) -> Tuple[Dict[str, Any], str]:
+    await role_registry.ensure_loaded()
     auth_user = await get_auth_user(access_token)
     user_id = auth_user.get("id") or auth_user.get("user", {}).get("id")
     email = auth_user.get("email") or auth_user.get("user", {}).get("email")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(
-            f"{REST_BASE}/users?select=id,email,role_id&id=eq.{user_id}",
-            headers=sb_headers(),
-        )
-        r.raise_for_status()
-        rows = r.json()
-        if not rows:
-            # auto-upsert as client if missing
-            client_role = _role_cache.get("client")
-            ins = await client.post(
-                f"{REST_BASE}/users",
-                headers=sb_headers(),
-                json=[{"id": user_id, "email": email, "role_id": client_role}],
-            )
-            ins.raise_for_status()
-            role_name = "client"
-            profile = {"id": user_id, "email": email, "role_id": client_role}
-        else:
-            profile = rows[0]
-            role_name = _role_rev_cache.get(profile["role_id"], "client")
+    cached = await profile_cache.get(user_id)
+    if cached is not None:
+        profile, role_name = cached
+        return profile, role_name
+
+    rows = await storage.select("users", [("id", f"eq.{user_id}")], "id,email,role_id")
+    if not rows:
+        # auto-upsert as client if missing
+        client_role = role_registry.id_for("client")
+        await storage.insert("users", [{"id": user_id, "email": email, "role_id": client_role}], returning=False)
+        role_name = "client"
+        profile = {"id": user_id, "email": email, "role_id": client_role}
+    else:
+        profile = rows[0]
+        role_name = role_registry.name_for(profile["role_id"])
+    await profile_cache.set(user_id, (profile, role_name))
     return profile, role_name
 
 
@@ -159,53 +1184,1501 @@ def require_bearer(token: Optional[str]) -> str:
     return token
 
 
+# -------- Rate limiting --------
+# Token buckets per (route, user id or client IP). RATE_LIMITS is "name=count/seconds,..."; routes
+# opt in with Depends(rate_limited("name")). RATE_LIMIT_STORE_URL (redis://...) shares buckets
+# across workers when the redis package is installed; otherwise buckets live in-process.
+# Anonymous requests are keyed by client IP only once the address is trustworthy: FORWARDED_ALLOW_IPS
+# is set (behind a proxy) or RATE_LIMIT_BY_IP=1 (clients connect directly). Otherwise every client
+# behind the ingress would share the proxy's bucket, so anonymous requests are not throttled.
+RATE_LIMIT_DEFAULTS = (
+    "auth_login=10/60,auth_register=5/60,transactions_create=30/60,investments_create=30/60,bulk=5/60,export=5/60"
+)
+RATE_LIMIT_BY_IP = os.environ.get("RATE_LIMIT_BY_IP", "1" if "FORWARDED_ALLOW_IPS" in os.environ else "0") == "1"
+
+
+def client_ip(request: Request) -> Optional[str]:
+    # Behind a proxy, uvicorn/gunicorn rewrite request.client from X-Forwarded-For, but only for
+    # connections from FORWARDED_ALLOW_IPS, so clients cannot pick their own bucket.
+    return request.client.host if request.client else None
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[int, float]]:
+    limits: Dict[str, Tuple[int, float]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rule = item.partition("=")
+        count, _, seconds = rule.partition("/")
+        limits[name.strip()] = (int(count), float(seconds or 1))
+    return limits
+
+
+class MemoryRateLimitStore:
+    def __init__(self, maxsize: int = 100000):
+        self._buckets = TTLCache(maxsize=maxsize, ttl=3600.0)
+
+    async def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        """Spend one token; returns (allowed, tokens left)."""
+        now = time.monotonic()
+        tokens, stamp = self._buckets.get(key) or (float(capacity), now)
+        tokens = min(float(capacity), tokens + (now - stamp) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets.set(key, (tokens, now), ttl=capacity / rate + 1)
+        return allowed, tokens
+
+
+class RedisRateLimitStore:
+    SCRIPT = """
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, url: str):
+        self._redis = redis_from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        allowed, tokens = await self._script(keys=[key], args=[capacity, rate, time.time()])
+        return bool(allowed), float(tokens)
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[int, float]], store: Any, by_ip: bool):
+        self.limits = limits
+        self.store = store
+        self.by_ip = by_ip
+        self.limited = 0
+        self.store_errors = 0
+
+    async def client_key(self, request: Request, authorization: Optional[str]) -> Optional[str]:
+        if authorization:
+            try:
+                profile, _ = await get_user_profile_with_role(authorization.replace("Bearer ", ""))
+                return f"user:{profile['id']}"
+            except HTTPException:
+                pass  # invalid token: the route itself answers 401; throttle by address meanwhile
+        return f"ip:{client_ip(request) or 'unknown'}" if self.by_ip else None
+
+    async def check(self, name: str, request: Request, response: Response, authorization: Optional[str]) -> None:
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        client = await self.client_key(request, authorization)
+        if client is None:
+            return
+        capacity, seconds = limit
+        rate = capacity / seconds
+        key = f"rl:{name}:{client}"
+        try:
+            allowed, tokens = await self.store.take(key, capacity, rate)
+        except Exception:
+            self.store_errors += 1  # shared store down: fail open rather than reject everyone
+            return
+        headers = {"X-RateLimit-Limit": str(capacity), "X-RateLimit-Remaining": str(int(tokens))}
+        if not allowed:
+            self.limited += 1
+            headers["Retry-After"] = str(max(1, math.ceil((1 - tokens) / rate)))
+            raise HTTPException(status_code=429, detail="Too many requests", headers=headers)
+        response.headers.update(headers)
+
+
+def _rate_limit_store() -> Any:
+    url = os.environ.get("RATE_LIMIT_STORE_URL")
+    if url and REDIS_AVAILABLE:
+        return RedisRateLimitStore(url)
+    return MemoryRateLimitStore()
+
+
+rate_limiter = RateLimiter(
+    parse_rate_limits(os.environ.get("RATE_LIMITS", RATE_LIMIT_DEFAULTS))
+    if os.environ.get("RATE_LIMIT_ENABLED", "1") != "0"
+    else {},
+    _rate_limit_store(),
+    by_ip=RATE_LIMIT_BY_IP,
+)
+
+
+def rate_limited(name: str) -> Any:
+    async def dependency(request: Request, response: Response, authorization: Optional[str] = Header(None)) -> None:
+        await rate_limiter.check(name, request, response, authorization)
+
+    return Depends(dependency)
+
+
+# -------- Audit log (system_logs) --------
+class AuditLog:
+    """Write-behind pipeline: handlers enqueue without waiting, a worker bulk-inserts batches.
+
+    A batch is written when it reaches AUDIT_BATCH_SIZE or AUDIT_FLUSH_INTERVAL after its first
+    event. When the queue is full new events are dropped and counted rather than slowing requests;
+    stop() drains whatever is queued. A batch the database rejects is split and retried, so one bad
+    event (e.g. a user_id with no users row) costs only itself.
+    """
+
+    def __init__(self, maxsize: int, batch_size: int, flush_interval: float):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional["asyncio.Queue[Dict[str, Any]]"] = None  # created by start(), on the serving loop
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @staticmethod
+    def _inet(value: Optional[str]) -> Optional[str]:
+        """system_logs.ip_address is INET; anything else (e.g. the test client's "testclient") is dropped."""
+        try:
+            return str(ipaddress.ip_address(value)) if value else None
+        except ValueError:
+            return None
+
+    def record(self, action: str, request: Optional[Request] = None, user_id: Optional[str] = None, **details: Any) -> None:
+        event = {
+            "action": action,
+            "user_id": user_id,
+            "details": details or None,
+            "ip_address": self._inet(client_ip(request)) if request is not None else None,
+            "user_agent": request.headers.get("user-agent") if request is not None else None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if self._queue is None:
+            self.dropped += 1  # not started: nothing would ever write it
+            return
+        try:
+            self._queue.put_nowait(event)
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _collect(self) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if self._stopping.is_set():
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    break
+            remaining = deadline - time.monotonic() if batch else self.flush_interval
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                if batch:
+                    break
+        return batch
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            await storage.insert("system_logs", batch, returning=False)
+            self.written += len(batch)
+        except HTTPException as exc:
+            if not 400 <= exc.status_code < 500:
+                self.failed += len(batch)  # outage rather than bad rows: retrying piecewise would not help
+            elif len(batch) > 1:
+                half = len(batch) // 2
+                await self._write(batch[:half])
+                await self._write(batch[half:])
+            elif batch[0]["user_id"]:
+                # Most likely the user_id foreign key (e.g. a login before the users row exists)
+                event = batch[0]
+                await self._write([{**event, "user_id": None, "details": {**(event["details"] or {}), "user_id": event["user_id"]}}])
+            else:
+                self.failed += 1
+        except Exception:
+            self.failed += len(batch)  # audit must never take the API down; count and move on
+
+    async def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = await self._collect()
+            if batch and storage.configured:
+                await self._write(batch)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+audit_log = AuditLog(
+    maxsize=_env_int("AUDIT_QUEUE_SIZE", 10000),
+    batch_size=_env_int("AUDIT_BATCH_SIZE", 200),
+    flush_interval=_env_float("AUDIT_FLUSH_INTERVAL", 1.0),
+)
+
+
+# -------- Push events --------
+class EventHub:
+    """In-process pub/sub: one bounded queue per connection; a slow reader loses its oldest events."""
+
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._subscribers: Dict[str, Set["asyncio.Queue[Tuple[int, str, Any]]"]] = {}
+        self._recent = TTLCache(maxsize=10000, ttl=300.0)  # (kind, id, state) already delivered
+        self._seq = 0
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: str) -> "asyncio.Queue[Tuple[int, str, Any]]":
+        queue: "asyncio.Queue[Tuple[int, str, Any]]" = asyncio.Queue(maxsize=self.buffer_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: "asyncio.Queue[Tuple[int, str, Any]]") -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def users(self) -> List[str]:
+        return list(self._subscribers)
+
+    def connections(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, user_id: Optional[str], event: str, data: Dict[str, Any], dedupe_key: Any = None) -> None:
+        if dedupe_key is not None:
+            if self._recent.get(dedupe_key) is not None:
+                return
+            self._recent.set(dedupe_key, True)
+        queues = self._subscribers.get(user_id or "")
+        if not queues:
+            return
+        self._seq += 1
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait((self._seq, event, data))
+        self.published += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"users": len(self._subscribers), "connections": self.connections(), "published": self.published, "dropped": self.dropped}
+
+
+class ChangeFeed:
+    """Polls transactions/notifications once per interval for every connected user, instead of
+    each client polling, and fans changes out through the hub. Idle while nobody is connected."""
+
+    IN_CHUNK = 100  # user ids per `in.(...)` filter, keeps URLs short
+    PAGE_LIMIT = 1000  # rows per chunk and poll; the rest is picked up by the next poll
+
+    def __init__(self, hub: EventHub, interval: float):
+        self.hub = hub
+        self.interval = interval
+        self.cursors: Dict[str, Tuple[str, str]] = {}  # table -> (timestamp, "gt" | "gte")
+        self.polls = 0
+        self.failures = 0
+        self._poller = PeriodicTask(self.poll_once, on_error=self._failed)
+
+    async def _poll_table(self, table: str, select: str, column: str, users: List[str]) -> List[Dict[str, Any]]:
+        since, op = self.cursors[table]
+        chunks = [users[i : i + self.IN_CHUNK] for i in range(0, len(users), self.IN_CHUNK)]
+
+        async def fetch(ids: List[str]) -> List[Dict[str, Any]]:
+            filters = [("user_id", f"in.({','.join(ids)})"), (column, f"{op}.{since}")]
+            return await storage.select(table, filters, select, order=f"{column}.asc", limit=self.PAGE_LIMIT)
+
+        parts = await asyncio.gather(*(fetch(ids) for ids in chunks))
+        rows = [row for part in parts for row in part]
+        if not rows:
+            return rows
+        truncated = [str(part[-1][column]) for part in parts if len(part) >= self.PAGE_LIMIT]
+        if not truncated:
+            self.cursors[table] = (max(str(row[column]) for row in rows), "gt")
+            return rows
+        # A truncated chunk has more rows after its last one, so resume from the earliest such point,
+        # inclusive since later rows may share that timestamp; rows seen twice are deduped by the hub.
+        resume = min(truncated)
+        if (resume, "gte") == (since, op):
+            self.cursors[table] = (resume, "gt")  # a full page on one timestamp: step past it
+        else:
+            self.cursors[table] = (resume, "gte")
+        return rows
+
+    async def poll_once(self) -> None:
+        users = self.hub.users()
+        if not users:
+            # nothing to deliver; start fresh from now when someone connects
+            self.cursors = {}
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        self.cursors.setdefault("transactions", (now, "gt"))
+        self.cursors.setdefault("notifications", (now, "gt"))
+        transactions, notifications = await asyncio.gather(
+            self._poll_table("transactions", "id,user_id,type,amount,status,admin_note,updated_at", "updated_at", users),
+            self._poll_table("notifications", "*", "created_at", users),
+        )
+        for row in transactions:
+            publish_transaction(row)
+        for row in notifications:
+            self.hub.publish(row.get("user_id"), "notification", row, dedupe_key=("notification", row.get("id")))
+        self.polls += 1
+
+    def _failed(self, error: Exception) -> None:
+        self.failures += 1
+
+    def start(self) -> None:
+        if storage.configured:
+            self._poller.start(self.interval)
+
+    async def stop(self) -> None:
+        await self._poller.stop()
+
+
+class StreamTickets:
+    """Short-lived single-use tickets for GET /api/user/events, so no bearer token ends up in a URL (and so
+    in access or proxy logs). With CACHE_URL a ticket issued by one worker can be redeemed on another."""
+
+    def __init__(self, ttl: float, shared: SharedCache):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=10000, ttl=ttl)
+        self.shared = shared
+
+    async def issue(self, user_id: str) -> str:
+        ticket = secrets.token_urlsafe(32)
+        self.local.set(ticket, user_id)
+        if self.shared.configured:
+            await self.shared.set(f"ticket:{ticket}", user_id, self.ttl)
+        return ticket
+
+    async def redeem(self, ticket: str) -> Optional[str]:
+        user_id = self.local.get(ticket)
+        self.local.pop(ticket)
+        if self.shared.configured:
+            key = f"ticket:{ticket}"
+            if user_id is None:
+                user_id = await self.shared.get(key)
+            if user_id is None or await self.shared.claim(f"{key}:used", True, self.ttl) is False:
+                return None
+            await self.shared.delete(key)
+        return user_id
+
+
+EVENTS_HEARTBEAT_INTERVAL = _env_float("EVENTS_HEARTBEAT_INTERVAL", 15.0)
+EVENTS_TICKET_TTL = _env_float("EVENTS_TICKET_TTL", 30.0)
+event_hub = EventHub(buffer_size=_env_int("EVENTS_BUFFER_SIZE", 100))
+change_feed = ChangeFeed(event_hub, interval=_env_float("EVENTS_POLL_INTERVAL", 2.0))
+stream_tickets = StreamTickets(EVENTS_TICKET_TTL, shared_cache)
+
+
+def publish_transaction(row: Dict[str, Any]) -> None:
+    event_hub.publish(row.get("user_id"), "transaction", row, dedupe_key=("transaction", row.get("id"), row.get("status")))
+
+
+def sse_message(seq: int, event: str, data: Any) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (seq, event.encode(), json_bytes(data))
+
+
+# -------- Bulk writes --------
+BULK_CHUNK_SIZE = _env_int("BULK_CHUNK_SIZE", 500)
+BULK_CONCURRENCY = _env_int("BULK_CONCURRENCY", 4)
+BULK_MAX_ITEMS = _env_int("BULK_MAX_ITEMS", 10000)
+
+
+def check_bulk_items(items: List[Dict[str, Any]]) -> None:
+    if not items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per request")
+
+
+async def bulk_insert(table: str, items: List[Dict[str, Any]], chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """Insert `items` in chunked PostgREST batch POSTs, a bounded number in flight; one result per item.
+
+    A chunk is inserted atomically, so a rejected chunk reports its error on every item in it.
+    """
+    size = max(1, chunk_size or BULK_CHUNK_SIZE)
+    results: List[Dict[str, Any]] = [{}] * len(items)
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def insert_chunk(start: int) -> None:
+        chunk = items[start : start + size]
+        async with semaphore:
+            try:
+                rows = await storage.insert(table, chunk)
+            except HTTPException as e:
+                error = e.detail
+            except httpx.HTTPError as e:
+                error = str(e) or e.__class__.__name__
+            else:
+                error = None
+        if error is not None:
+            for i in range(len(chunk)):
+                results[start + i] = {"index": start + i, "status": "error", "error": error}
+            return
+        for i in range(len(chunk)):
+            results[start + i] = {"index": start + i, "status": "created", "row": rows[i] if i < len(rows) else None}
+
+    await asyncio.gather(*(insert_chunk(start) for start in range(0, len(items), size)))
+    created = sum(1 for x in results if x["status"] == "created")
+    return {"created": created, "failed": len(items) - created, "results": results}
+
+
+# -------- Idempotency keys --------
+# With CACHE_URL set, results and in-flight markers also live in the shared tier, so a retry that
+# lands on another worker replays (or waits for) the first attempt instead of repeating it.
+IDEMPOTENCY_TTL = _env_float("IDEMPOTENCY_TTL", 86400.0)
+IDEMPOTENCY_MAX_KEYS = _env_int("IDEMPOTENCY_MAX_KEYS", 10000)
+IDEMPOTENCY_KEY_MAX_LEN = 255
+IDEMPOTENCY_LOCK_TTL = _env_float("IDEMPOTENCY_LOCK_TTL", 60.0)  # longest a request may hold its key
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+
+class IdempotencyStore:
+    """First successful result per (scope, Idempotency-Key), replayed for retries of the same request.
+
+    Concurrent duplicates wait on the in-flight call; failures are not stored so they can be retried.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, shared: SharedCache, lock_ttl: float):
+        self.results = TTLCache(maxsize, ttl)
+        self.flight = SingleFlight()
+        self.shared = shared
+        self.lock_ttl = lock_ttl
+        self._pending: Dict[Tuple[str, str], str] = {}
+        self.replayed = 0
+        self.conflicts = 0
+
+    def _conflict(self) -> HTTPException:
+        self.conflicts += 1
+        return HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    async def run(self, scope: str, key: str, fingerprint: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        cache_key = (scope, key)
+        entry = self.results.get(cache_key)
+        seen = entry[0] if entry is not None else self._pending.get(cache_key)
+        if seen is not None and seen != fingerprint:
+            raise self._conflict()
+        if entry is not None:
+            self.replayed += 1
+            return entry[1], True
+
+        async def call() -> Tuple[Any, bool]:
+            try:
+                outcome = await self._run_shared(scope, key, fingerprint, fn) if self.shared.configured else (await fn(), False)
+                self.results.set(cache_key, (fingerprint, outcome[0]))
+                return outcome
+            finally:
+                self._pending.pop(cache_key, None)
+
+        joined = cache_key in self._pending
+        self._pending[cache_key] = fingerprint
+        result, replayed = await self.flight.do(cache_key, call)
+        if joined or replayed:
+            self.replayed += 1
+        return result, joined or replayed
+
+    async def _run_shared(self, scope: str, key: str, fingerprint: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Claim the key across workers with SET NX, or wait for whoever holds it; runs local-only if the tier is down."""
+        name = hashlib.sha256(json_bytes([scope, key])).hexdigest()
+        result_key, lock_key = f"idem:{name}", f"idem:lock:{name}"
+        deadline = time.monotonic() + self.lock_ttl
+        while True:
+            stored = await self.shared.get(result_key)
+            if stored is not None:
+                if stored["fingerprint"] != fingerprint:
+                    raise self._conflict()
+                return stored["result"], True
+            if await self.shared.claim(lock_key, fingerprint, self.lock_ttl) is not False:
+                break
+            holder = await self.shared.get(lock_key)
+            if holder is not None and holder != fingerprint:
+                raise self._conflict()
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+        try:
+            result = await fn()
+            await self.shared.set(result_key, {"fingerprint": fingerprint, "result": result}, self.results.ttl)
+        finally:
+            await self.shared.delete(lock_key)
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.results.stats(),
+            "in_flight": len(self._pending),
+            "replayed": self.replayed,
+            "coalesced": self.flight.coalesced,
+            "conflicts": self.conflicts,
+        }
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL, shared_cache, IDEMPOTENCY_LOCK_TTL)
+
+
+async def idempotent(
+    request: Request,
+    response: Response,
+    scope: str,
+    key: Optional[str],
+    payload: Any,
+    fn: Callable[[], Awaitable[Any]],
+) -> Any:
+    """Run `fn` once per Idempotency-Key; a replay gets the stored body and an Idempotent-Replayed header."""
+    if key is None:
+        return await fn()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LEN:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LEN} characters")
+    if isinstance(payload, list):
+        payload = [item.model_dump(mode="json") for item in payload]
+    elif isinstance(payload, BaseModel):
+        payload = payload.model_dump(mode="json")
+    fingerprint = hashlib.sha256(json_bytes([request.url.path, str(request.query_params), payload])).hexdigest()
+    result, replayed = await idempotency_store.run(scope, key, fingerprint, fn)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+# -------- Keyset pagination --------
+# Pages are ordered newest first on (created_at, id); the cursor is the last row's pair.
+PAGE_DEFAULT_LIMIT = _env_int("PAGE_DEFAULT_LIMIT", 100)
+PAGE_MAX_LIMIT = _env_int("PAGE_MAX_LIMIT", 1000)
+
+TRANSACTION_COLUMNS = {
+    "id", "user_id", "type", "crypto_type", "amount", "usd_value", "wallet_address", "transaction_hash",
+    "fee_amount", "status", "admin_note", "created_at", "updated_at",
+}
+TRANSACTION_STATUSES = {"pending", "approved", "rejected", "failed"}
+TRANSACTION_TYPES = {"deposit", "withdrawal"}
+INVESTMENT_COLUMNS = {
+    "id", "user_id", "plan_id", "amount", "profit_target", "current_profit", "status", "start_date", "end_date",
+    "created_at",
+}
+INVESTMENT_STATUSES = {"active", "completed", "cancelled"}
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, row_id = json.loads(_b64url_decode(cursor))
+        datetime.fromisoformat(str(created_at))
+        uuid.UUID(str(row_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return str(created_at), str(row_id)
+
+
+def select_columns(fields: Optional[str], allowed: set, default: str, extra: Iterable[str] = ()) -> str:
+    """PostgREST `select` for a comma-separated `fields` projection; keyset and `extra` columns are always included."""
+    if not fields:
+        return default
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ",".join(dict.fromkeys(requested + ["id", "created_at", *extra]))
+
+
+def check_choice(name: str, value: Optional[str], allowed: set) -> None:
+    if value is not None and value not in allowed:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: expected one of {', '.join(sorted(allowed))}")
+
+
+def date_range_filters(column: str, date_from: Optional[datetime], date_to: Optional[datetime]) -> List[Tuple[str, str]]:
+    params: List[Tuple[str, str]] = []
+    if date_from is not None:
+        params.append((column, f"gte.{date_from.isoformat()}"))
+    if date_to is not None:
+        params.append((column, f"lt.{date_to.isoformat()}"))
+    return params
+
+
+async def fetch_keyset_page(
+    table: str,
+    select: str,
+    filters: List[Tuple[str, str]],
+    limit: int,
+    cursor: Optional[str],
+    bearer: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    before = decode_cursor(cursor) if cursor else None
+    rows = await storage.select(
+        table, filters, select, order="created_at.desc,id.desc", limit=limit + 1, before=before, bearer=bearer
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+
+def transaction_filters(
+    status: Optional[str],
+    type: Optional[str],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+) -> List[Tuple[str, str]]:
+    check_choice("status", status, TRANSACTION_STATUSES)
+    check_choice("type", type, TRANSACTION_TYPES)
+    filters: List[Tuple[str, str]] = []
+    if status:
+        filters.append(("status", f"eq.{status}"))
+    if type:
+        filters.append(("type", f"eq.{type}"))
+    return filters + date_range_filters("created_at", date_from, date_to)
+
+
+# -------- Streaming export --------
+# Exports walk the keyset pages and encode each one as it arrives, so memory stays
+# bounded by EXPORT_PAGE_SIZE whatever the history length.
+EXPORT_PAGE_SIZE = _env_int("EXPORT_PAGE_SIZE", 1000)
+EXPORT_COLUMNS = [
+    "id", "user_id", "type", "crypto_type", "amount", "usd_value", "fee_amount", "status", "wallet_address",
+    "transaction_hash", "admin_note", "created_at", "updated_at",
+]
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+async def iter_keyset_pages(
+    table: str, select: str, filters: List[Tuple[str, str]], bearer: Optional[str] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    cursor: Optional[str] = None
+    while True:
+        rows, cursor = await fetch_keyset_page(table, select, filters, EXPORT_PAGE_SIZE, cursor, bearer)
+        if rows:
+            yield rows
+        if not cursor:
+            return
+
+
+def encode_ndjson(rows: Iterable[Dict[str, Any]]) -> bytes:
+    return b"".join(json_bytes(row) + b"\n" for row in rows)
+
+
+def encode_csv(rows: Iterable[Dict[str, Any]], header: bool = False) -> bytes:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue().encode()
+
+
+async def encode_export(pages: AsyncIterator[List[Dict[str, Any]]], fmt: str) -> AsyncIterator[bytes]:
+    if fmt == "csv":
+        yield encode_csv([], header=True)
+    async for rows in pages:
+        yield encode_csv(rows) if fmt == "csv" else encode_ndjson(rows)
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    async for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def export_response(
+    request: Request, filters: List[Tuple[str, str]], fmt: str, name: str, bearer: Optional[str] = None
+) -> StreamingResponse:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format: expected one of {', '.join(EXPORT_FORMATS)}")
+    body = encode_export(iter_keyset_pages("transactions", ",".join(EXPORT_COLUMNS), filters, bearer), fmt)
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[fmt], headers=headers)
+
+
+# -------- Response cache --------
+# Public catalog payloads are stored pre-serialized with a strong ETag so hits skip
+# both the upstream call and JSON encoding, and conditional GETs get a 304.
+class CachedBody:
+    __slots__ = ("data", "body", "etag")
+
+    def __init__(self, data: Any, body: bytes):
+        self.data = data
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class ResponseCache:
+    def __init__(self, ttl: float, maxsize: int = 64):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight = SingleFlight()
+        self._generation = 0
+
+    async def get_or_load(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> CachedBody:
+        entry = self._cache.get(key)
+        if entry is None:
+            entry = await self._flight.do((key, self._generation), lambda: self._load(key, loader))
+        return entry
+
+    async def _load(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> CachedBody:
+        generation = self._generation
+        data = await loader()
+        entry = CachedBody(data, json_bytes(data))
+        if generation == self._generation:  # skip storing a load that raced an invalidation
+            self._cache.set(key, entry)
+        return entry
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._cache.stats(), "coalesced": self._flight.coalesced}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def cached_json_response(request: Request, entry: CachedBody) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "public, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+plans_response_cache = ResponseCache(ttl=_env_float("CATALOG_CACHE_TTL", 60.0))
+roles_response_cache = ResponseCache(ttl=_env_float("CATALOG_CACHE_TTL", 60.0))
+
+
+def plans_changed(rows: List[Dict[str, Any]]) -> None:
+    """Runs in every worker when plans are created (see shared_cache.publish)."""
+    plan_catalog.upsert(rows)
+    plans_response_cache.invalidate()
+
+
+shared_cache.on("plans", plans_changed)
+
+
+# -------- Price feed --------
+# Latest EUR price per crypto_type, kept in memory so transactions are valued server-side
+# and /api/prices never leaves the process. PRICE_SOURCE is either "file:/path/prices.json"
+# (local runs and tests) or an http(s) URL; both return {"BTC": 61234.5, ...} or {"prices": {...}}.
+PRICE_SOURCE = os.environ.get("PRICE_SOURCE", "")
+PRICE_REFRESH_INTERVAL = _env_float("PRICE_REFRESH_INTERVAL", 30.0)
+PRICE_MAX_AGE = _env_float("PRICE_MAX_AGE", 300.0)
+FEE_RATES = {
+    TransactionType.deposit.value: Decimal(os.environ.get("DEPOSIT_FEE_RATE", "0")),
+    TransactionType.withdrawal.value: Decimal(os.environ.get("WITHDRAWAL_FEE_RATE", "0")),
+}
+CENT = Decimal("0.01")
+SATOSHI = Decimal("0.00000001")
+
+
+def parse_prices(data: Any) -> Dict[str, Decimal]:
+    if isinstance(data, dict) and isinstance(data.get("prices"), dict):
+        data = data["prices"]
+    if not isinstance(data, dict):
+        raise ValueError("Price source must return an object of crypto_type -> price")
+    prices: Dict[str, Decimal] = {}
+    for symbol, price in data.items():
+        value = Decimal(str(price))
+        if value.is_finite() and value > 0:
+            prices[str(symbol).upper()] = value
+    return prices
+
+
+class FilePriceSource:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> Any:
+        with open(self.path, "rb") as f:
+            return json.loads(f.read(), parse_float=Decimal)
+
+    async def fetch(self) -> Dict[str, Decimal]:
+        return parse_prices(await asyncio.to_thread(self._read))
+
+
+class HttpPriceSource:
+    def __init__(self, url: str):
+        self.url = url
+
+    async def fetch(self) -> Dict[str, Decimal]:
+        r = await http_client().get(self.url)
+        r.raise_for_status()
+        return parse_prices(json.loads(r.content, parse_float=Decimal))
+
+
+def make_price_source(spec: str) -> Any:
+    if not spec:
+        return None
+    if spec.startswith("file:"):
+        return FilePriceSource(spec[len("file:"):])
+    if spec.startswith(("http://", "https://")):
+        return HttpPriceSource(spec)
+    raise RuntimeError(f"Unknown PRICE_SOURCE: {spec}")
+
+
+class PriceFeed:
+    """Latest-price table swapped whole on each refresh; concurrent refreshes share one fetch."""
+
+    def __init__(self, source: Any, refresh_interval: float, max_age: float):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.prices: Dict[str, Decimal] = {}
+        self.body: Optional[CachedBody] = None
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._flight = SingleFlight()
+        # failures are counted by _load(); the previous table is kept until it exceeds max_age
+        self._refresher = PeriodicTask(self.refresh)
+
+    @property
+    def configured(self) -> bool:
+        return self.source is not None
+
+    def age(self) -> Optional[float]:
+        return None if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    def fresh(self) -> bool:
+        age = self.age()
+        return age is not None and age <= self.max_age
+
+    async def refresh(self) -> None:
+        await self._flight.do("prices", self._load)
+
+    async def _load(self) -> None:
+        try:
+            prices = await self.source.fetch()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e) or e.__class__.__name__
+            raise
+        data = {
+            "currency": "EUR",
+            "as_of": datetime.now(timezone.utc).isoformat(),
+            "prices": {symbol: float(price) for symbol, price in sorted(prices.items())},
+        }
+        # /api/prices serves this body as-is, so it is encoded once per refresh rather than per request
+        self.prices, self.body = prices, CachedBody(data, json_bytes(data))
+        self.loaded_at = time.monotonic()
+        self.refreshes += 1
+        self.last_error = None
+
+    async def current(self) -> CachedBody:
+        """The latest snapshot, refreshing first if it is older than max_age; 503 when no fresh prices exist."""
+        if not self.configured:
+            raise HTTPException(status_code=503, detail="Price feed not configured")
+        if not self.fresh():
+            try:
+                await self.refresh()
+            except Exception:
+                pass  # reported below and in /api/health
+        if self.body is None or not self.fresh():
+            raise HTTPException(status_code=503, detail="Price feed unavailable", headers={"Retry-After": "5"})
+        return self.body
+
+    def quote(self, crypto_type: str, amount: Decimal, type: str) -> Tuple[Decimal, Decimal]:
+        """(EUR value rounded to cents, fee in crypto rounded to 8 places) from the current table."""
+        price = self.prices.get(crypto_type.upper())
+        if price is None:
+            raise HTTPException(status_code=400, detail=f"No price for crypto_type {crypto_type}")
+        usd_value = (amount * price).quantize(CENT, rounding=ROUND_HALF_UP)
+        fee_amount = (amount * FEE_RATES.get(type, Decimal(0))).quantize(SATOSHI, rounding=ROUND_HALF_UP)
+        return usd_value, fee_amount
+
+    def start(self) -> None:
+        if self.configured:
+            self._refresher.start(self.refresh_interval)
+
+    async def stop(self) -> None:
+        await self._refresher.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": type(self.source).__name__ if self.source else None,
+            "symbols": len(self.prices),
+            "age_seconds": self.age(),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "coalesced": self._flight.coalesced,
+            "last_error": self.last_error,
+        }
+
+
+price_feed = PriceFeed(make_price_source(PRICE_SOURCE), PRICE_REFRESH_INTERVAL, PRICE_MAX_AGE)
+
+
+async def transaction_rows(items: List[TransactionCreate], user_id: str) -> List[Dict[str, Any]]:
+    """Insert rows with usd_value and fee_amount priced server-side; the client's usd_value is only used without a feed."""
+    if not price_feed.configured:
+        if any(item.usd_value is None for item in items):
+            raise HTTPException(status_code=422, detail="usd_value is required when no price feed is configured")
+        return [to_row(item, user_id=user_id) for item in items]
+    await price_feed.current()
+    rows = []
+    for item in items:
+        usd_value, fee_amount = price_feed.quote(item.crypto_type, item.amount, item.type.value)
+        rows.append(to_row(item, user_id=user_id, usd_value=float(usd_value), fee_amount=float(fee_amount)))
+    return rows
+
+
+# -------- Admin stats --------
+class AdminStats:
+    """get_dashboard_stats() snapshot served stale-while-revalidate, adjusted by local write counters.
+
+    The RPC scans users, user_investments and transactions, so it runs at most once per TTL and
+    only while someone is looking; between refreshes our own create_* endpoints bump the
+    counters they know about so the admin view stays current.
+    """
+
+    COUNTERS = ("pending_transactions", "active_investments")
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.fetched_at: Optional[float] = None
+        self.as_of: Optional[str] = None
+        self.refreshes = 0
+        self.failures = 0
+        self._deltas: Dict[str, int] = {name: 0 for name in self.COUNTERS}
+        self._flight = SingleFlight()
+
+    def bump(self, counter: str, by: int = 1) -> None:
+        self._deltas[counter] += by
+
+    def age(self) -> Optional[float]:
+        return None if self.fetched_at is None else time.monotonic() - self.fetched_at
+
+    async def refresh(self) -> None:
+        await self._flight.do("stats", self._fetch)
+
+    async def _fetch(self) -> None:
+        counted = dict(self._deltas)
+        try:
+            snapshot = await storage.dashboard_stats()
+        except Exception:
+            self.failures += 1
+            raise
+        # writes seen before the fetch started are now part of the snapshot
+        for name, value in counted.items():
+            self._deltas[name] -= value
+        self.snapshot = snapshot
+        self.fetched_at = time.monotonic()
+        self.as_of = datetime.now(timezone.utc).isoformat()
+        self.refreshes += 1
+
+    def _refresh_in_background(self) -> None:
+        task = asyncio.ensure_future(self.refresh())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # failure is counted, keep serving stale
+
+    async def get(self) -> Dict[str, Any]:
+        age = self.age()
+        if age is None:
+            await self.refresh()
+        elif age >= self.ttl:
+            self._refresh_in_background()
+        stats = dict(self.snapshot or {})
+        for name, delta in self._deltas.items():
+            if name in stats:
+                stats[name] = max(0, int(stats[name]) + delta)
+        return {**stats, "as_of": self.as_of, "age_seconds": self.age()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"age_seconds": self.age(), "refreshes": self.refreshes, "failures": self.failures, **self._deltas}
+
+
+admin_stats = AdminStats(ttl=_env_float("ADMIN_STATS_TTL", 15.0))
+
+
+# -------- Profit accrual --------
+# numpy is optional: it vectorizes the accrual math when installed, otherwise a per-row loop is used.
+# It is imported by the first accrual pass rather than at startup.
+ACCRUAL_VECTORIZE = os.environ.get("ACCRUAL_VECTORIZE", "1") != "0" and importlib.util.find_spec("numpy") is not None
+np: Any = None
+
+
+def load_numpy() -> Any:
+    global np
+    if not ACCRUAL_VECTORIZE:
+        return None
+    if np is None:
+        import numpy
+
+        np = numpy
+    return np
+
+
+ACCRUAL_INTERVAL = _env_float("ACCRUAL_INTERVAL", 3600.0)
+ACCRUAL_BATCH_SIZE = _env_int("ACCRUAL_BATCH_SIZE", 1000)
+
+
+def _utc_text(value: Any) -> str:
+    """Naive UTC ISO text for numpy's datetime64 parser, which rejects offsets."""
+    text = str(value)
+    if text.endswith("+00:00"):
+        return text[:-6]
+    if text.endswith("Z"):
+        return text[:-1]
+    return _parse_ts(text).astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _target_cents(row: Dict[str, Any], plan: Optional[Dict[str, Any]]) -> int:
+    """The stored profit_target in cents, capped at what the plan pays on the row's amount."""
+    if plan is None:
+        return 0
+    cap = int(plan_profit_target(plan, row.get("amount") or 0).scaleb(2))
+    stored = row.get("profit_target")
+    return cap if stored is None else min(cap, round(float(stored) * 100))
+
+
+def _accrued_cents(
+    rows: List[Dict[str, Any]], terms: List[Optional[int]], targets: List[int], now: datetime
+) -> Tuple[List[int], List[int], List[bool]]:
+    """(accrued, current, matured) in whole cents; accrued is -1 where the term cannot be determined."""
+    if load_numpy() is not None:
+        start = np.array([_utc_text(row.get("start_date") or row["created_at"]) for row in rows], dtype="datetime64[us]")
+        start_s = start.astype(np.int64) / 1e6
+        days = np.array([np.nan if d is None else d for d in terms], dtype=np.float64)
+        end_s = start_s + days * 86400
+        target = np.array(targets, dtype=np.int64)
+        current = np.rint(np.array([row.get("current_profit") or 0 for row in rows], dtype=np.float64) * 100).astype(np.int64)
+        term = end_s - start_s
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.clip((now.timestamp() - start_s) / np.where(term > 0, term, 1), 0, 1)
+        matured = now.timestamp() >= end_s
+        accrued = np.where(matured, target, np.floor(target * share).astype(np.int64))
+        accrued = np.where(np.isnan(end_s), -1, np.maximum(accrued, current))  # never take profit back
+        return accrued.tolist(), current.tolist(), matured.tolist()
+
+    accrued_out: List[int] = []
+    current_out: List[int] = []
+    matured_out: List[bool] = []
+    for row, days, target in zip(rows, terms, targets):
+        current = round(float(row.get("current_profit") or 0) * 100)
+        current_out.append(current)
+        if days is None:
+            accrued_out.append(-1)
+            matured_out.append(False)
+            continue
+        start = _parse_ts(row.get("start_date") or row["created_at"])
+        end = start + timedelta(days=days)
+        term = (end - start).total_seconds()
+        share = min(max((now - start).total_seconds() / (term if term > 0 else 1), 0.0), 1.0)
+        matured = now >= end
+        accrued_out.append(max(target if matured else math.floor(target * share), current))
+        matured_out.append(matured)
+    return accrued_out, current_out, matured_out
+
+
+def accrue_batch(
+    rows: List[Dict[str, Any]], plans: List[Optional[Dict[str, Any]]], now: datetime
+) -> List[Dict[str, Any]]:
+    """{id, current_profit, status} for rows whose profit advances: the target times the elapsed share of
+    the term, rounded down to the cent.
+
+    Only the plan sets the terms: the term is start_date + the plan's duration_days and the target is
+    profit_target capped at the plan's percent of amount, whatever end_date or profit_target a row holds.
+    Matured rows are completed at the target; rows without a plan or duration are skipped. Cents are
+    turned into Decimal only for the rows that changed.
+    """
+    if not rows:
+        return []
+    terms = [int(plan["duration_days"]) if plan and plan.get("duration_days") else None for plan in plans]
+    targets = [_target_cents(row, plan) for row, plan in zip(rows, plans)]
+    changed = []
+    active, completed = InvestmentStatus.active.value, InvestmentStatus.completed.value
+    for row, accrued, current, matured in zip(rows, *_accrued_cents(rows, terms, targets, now)):
+        if accrued < 0 or (accrued == current and not matured):
+            continue
+        changed.append({
+            "id": row["id"],
+            "current_profit": float(Decimal(accrued).scaleb(-2)),
+            "status": completed if matured else active,
+        })
+    return changed
+
+
+class ProfitAccrual:
+    """Pages through active investments, advancing current_profit and completing matured ones."""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.runs = 0
+        self.failures = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+        # failures are counted by run_once(); the next pass picks up where accrual stands
+        self._runner = PeriodicTask(self.run_once)
+
+    @staticmethod
+    async def _apply(changes: List[Dict[str, Any]], totals: Dict[str, int]) -> None:
+        applied = await storage.apply_accrual(changes)
+        totals["updated"] += applied["updated"]
+        totals["completed"] += applied["completed"]
+        admin_stats.bump("active_investments", -applied["completed"])
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        async with self._lock:
+            started = time.perf_counter()
+            now = now or datetime.now(timezone.utc)
+            scanned = 0
+            totals = {"updated": 0, "completed": 0}
+            before: Optional[Keyset] = None
+            write: Optional["asyncio.Future[None]"] = None
+            try:
+                while True:
+                    rows = await storage.select(
+                        "user_investments",
+                        [("status", "eq.active")],
+                        order="created_at.desc,id.desc",
+                        limit=self.batch_size,
+                        before=before,
+                    )
+                    await plan_catalog.ensure_plans(rows)
+                    changes = accrue_batch(rows, [plan_catalog.get(row.get("plan_id")) for row in rows], now)
+                    if write is not None:
+                        await write
+                    # write this page while the next one is fetched
+                    write = asyncio.ensure_future(self._apply(changes, totals)) if changes else None
+                    scanned += len(rows)
+                    if len(rows) < self.batch_size:
+                        break
+                    before = (str(rows[-1]["created_at"]), str(rows[-1]["id"]))
+                if write is not None:
+                    await write
+            except Exception:
+                if write is not None and not write.done():
+                    write.cancel()
+                self.failures += 1
+                raise
+            self.runs += 1
+            self.last_run = {
+                "as_of": now.isoformat(),
+                "scanned": scanned,
+                **totals,
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            return self.last_run
+
+    def start(self) -> None:
+        if not self._runner.running:
+            self._lock = asyncio.Lock()
+        if storage.configured:
+            self._runner.start(self.interval)
+
+    async def stop(self) -> None:
+        await self._runner.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"runs": self.runs, "failures": self.failures, "vectorized": ACCRUAL_VECTORIZE, "last_run": self.last_run}
+
+
+profit_accrual = ProfitAccrual(ACCRUAL_INTERVAL, ACCRUAL_BATCH_SIZE)
+
+
+# -------- Transaction review --------
+# Admins decide pending transactions in batches. storage.decide_transactions does it in one step
+# (on Supabase the decide_transactions() function, a single statement): only rows still pending
+# are decided, and users.total_invested and the notifications change with them, so a retry cannot
+# decide a transaction or apply its balance twice. The notification texts are in storage.py.
+REVIEW_MAX_IDS = _env_int("REVIEW_MAX_IDS", 1000)
+
+
+def cache_gauges() -> List[Tuple[str, Dict[str, str], float]]:
+    out: List[Tuple[str, Dict[str, str], float]] = []
+    caches = {
+        "auth": auth_cache.stats(),
+        "profile": profile_cache.stats(),
+        "plans_response": plans_response_cache.stats(),
+        "roles_response": roles_response_cache.stats(),
+        "idempotency": idempotency_store.stats(),
+    }
+    for name, stats in caches.items():
+        lookups = stats["hits"] + stats["misses"]
+        out += [
+            ("cache_hits_total", {"cache": name}, stats["hits"]),
+            ("cache_misses_total", {"cache": name}, stats["misses"]),
+            ("cache_evictions_total", {"cache": name}, stats["evictions"]),
+            ("cache_hit_ratio", {"cache": name}, round(stats["hits"] / lookups, 4) if lookups else 0),
+        ]
+    out.append(("roles_registry_age_seconds", {}, role_registry.age() or 0))
+    out.append(("plan_catalog_age_seconds", {}, plan_catalog.age() or 0))
+    for name, breaker in breakers.items():
+        out.append(("supabase_breaker_open", {"upstream": name}, int(breaker.state != "closed")))
+        out.append(("supabase_breaker_rejected_total", {"upstream": name}, breaker.rejected))
+    out.append(("supabase_retries_total", {}, retry_budget.spent))
+    out.append(("supabase_retries_denied_total", {}, retry_budget.denied))
+    out.append(("supabase_hedges_total", {}, hedges_sent))
+    out.append(("supabase_admission_shed_total", {}, upstream_shed))
+    out.append(("shared_cache_errors_total", {}, shared_cache.errors))
+    out.append(("shared_cache_invalidations_received_total", {}, shared_cache.received))
+    out.append(("rate_limited_total", {}, rate_limiter.limited))
+    out.append(("events_connections", {}, event_hub.connections()))
+    out.append(("events_dropped_total", {}, event_hub.dropped))
+    for name, value in audit_log.stats().items():
+        out.append(("audit_events", {"state": name}, value))
+    out.append(("idempotent_replays_total", {}, idempotency_store.replayed))
+    out.append(("price_feed_age_seconds", {}, price_feed.age() or 0))
+    out.append(("price_feed_failures_total", {}, price_feed.failures))
+    out.append(("accrual_runs_total", {}, profit_accrual.runs))
+    out.append(("accrual_failures_total", {}, profit_accrual.failures))
+    if profit_accrual.last_run:
+        out.append(("accrual_last_run_seconds", {}, profit_accrual.last_run["seconds"]))
+    return out
+
+
+metrics.gauges.append(cache_gauges)
+
+
+# -------- Upstream error mapping --------
+@app.exception_handler(httpx.HTTPStatusError)
+async def upstream_status_error(request: Request, exc: httpx.HTTPStatusError):
+    return DefaultJSONResponse({"detail": f"Upstream error ({exc.response.status_code})"}, status_code=502)
+
+
+@app.exception_handler(httpx.TransportError)
+async def upstream_transport_error(request: Request, exc: httpx.TransportError):
+    if isinstance(exc, httpx.TimeoutException):
+        return DefaultJSONResponse({"detail": "Upstream timeout"}, status_code=504)
+    return DefaultJSONResponse({"detail": "Upstream unreachable"}, status_code=502, headers={"Retry-After": "1"})
+
+
+# -------- Lifecycle --------
+# Startup pre-warms what the first requests would otherwise pay for, concurrently: Supabase connections
+# (TCP/TLS handshakes), storage indexes, the role registry, the plan catalog and the price table.
+# The lifespan waits up to WARMUP_TIMEOUT for it; anything slower finishes in the background while
+# /api/ready answers 503. /api/health stays a liveness check.
+WARMUP_TIMEOUT = _env_float("WARMUP_TIMEOUT", 10.0)
+WARMUP_CONNECTIONS = _env_int("WARMUP_CONNECTIONS", 4)
+
+
+async def warm_http_pool() -> None:
+    if not (AUTH_BASE and SUPABASE_ANON_KEY):
+        return
+    client = http_client()
+    # only the handshakes matter, so any status will do
+    await asyncio.gather(
+        *(client.get(f"{AUTH_BASE}/health", headers=sb_headers(json=False)) for _ in range(WARMUP_CONNECTIONS))
+    )
+
+
+class Warmup:
+    """Runs the startup steps concurrently; a later run only retries the steps that failed."""
+
+    def __init__(self) -> None:
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.runs = 0
+        self.seconds: Optional[float] = None
+        self._task: Optional["asyncio.Future[None]"] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _step(self, name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        if self.steps.get(name, {}).get("ok"):
+            return
+        started = time.perf_counter()
+        try:
+            await fn()
+        except Exception as e:
+            self.steps[name] = {"ok": False, "seconds": round(time.perf_counter() - started, 4), "error": str(e) or e.__class__.__name__}
+        else:
+            self.steps[name] = {"ok": True, "seconds": round(time.perf_counter() - started, 4)}
+
+    async def _tables(self) -> None:
+        await self._step("storage", storage.prepare)  # Mongo seeds roles here, so the snapshots load after it
+        await asyncio.gather(self._step("roles", role_registry.ensure_loaded), self._step("plans", plan_catalog.ensure_loaded))
+
+    async def _run(self) -> None:
+        started = time.perf_counter()
+        steps = [self._step("http_pool", warm_http_pool), self._tables()]
+        if price_feed.configured:
+            steps.append(self._step("prices", price_feed.refresh))
+        await asyncio.gather(*steps)
+        self.runs += 1
+        self.seconds = round(time.perf_counter() - started, 4)
+
+    def start(self) -> "asyncio.Future[None]":
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        await cancel_task(self._task)
+
+    def ready(self) -> bool:
+        if self.runs == 0 or self.running:
+            return False
+        if storage.configured and (role_registry.loaded_at is None or plan_catalog.loaded_at is None):
+            return False
+        return not price_feed.configured or price_feed.loaded_at is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready(), "running": self.running, "runs": self.runs, "seconds": self.seconds, "steps": self.steps}
+
+
+warmup = Warmup()
+
+
+async def on_startup() -> None:
+    global upstream_slots
+    # Queues, locks and semaphores belong to the event loop that first waits on them, and these objects
+    # outlive one lifespan (tests and benches run several), so each startup gives them fresh ones.
+    upstream_slots = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+    role_registry.start()
+    plan_catalog.start()
+    audit_log.start()
+    profit_accrual.start()
+    try:
+        await asyncio.wait_for(asyncio.shield(warmup.start()), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass  # keeps warming in the background; /api/ready reports 503 until it is done
+    price_feed.start()
+    shared_cache.start()
+    change_feed.start()
+
+
+async def on_shutdown() -> None:
+    await warmup.stop()
+    await role_registry.stop()
+    await plan_catalog.stop()
+    await change_feed.stop()
+    await profit_accrual.stop()
+    await price_feed.stop()
+    await audit_log.stop()
+    await shared_cache.stop()
+    await close_http_client()
+
+
 # -------- Routes --------
 @app.get("/api/health")
 async def health():
-    mongo_status = False
-    mongo_error: Optional[str] = None
-    if MONGO_URL and roles_collection is not None:
-        try:
-            await roles_collection.database.command("ping")
-            mongo_status = True
-        except Exception as e:
-            mongo_error = str(e)
-    else:
-        mongo_error = "MONGO_URL not configured or client not initialized"
+    storage_error: Optional[str] = None
+    try:
+        await storage.ping()
+    except Exception as e:
+        storage_error = str(e) or e.__class__.__name__
 
     supabase_ready = bool(SUPABASE_URL and SUPABASE_ANON_KEY)
 
     return {
         "status": "ok",
         "backend_time": datetime.now(timezone.utc).isoformat(),
-        "mongo": {"connected": mongo_status, "error": mongo_error},
+        "storage": {"backend": storage.name, "connected": storage_error is None, "error": storage_error},
         "supabase": {
             "configured": supabase_ready,
             "url_present": bool(SUPABASE_URL),
             "key_present": bool(SUPABASE_ANON_KEY),
         },
+        "upstream": {
+            "breakers": {name: breaker.stats() for name, breaker in breakers.items()},
+            "retry_budget": {"tokens": round(retry_budget.tokens, 2), "spent": retry_budget.spent, "denied": retry_budget.denied},
+            "hedges": hedges_sent,
+            "shed": upstream_shed,
+        },
+        "audit": audit_log.stats(),
+        "warmup": warmup.stats(),
+        "accrual": profit_accrual.stats(),
+        "prices": price_feed.stats(),
+        "events": {**event_hub.stats(), "polls": change_feed.polls, "poll_failures": change_feed.failures},
+        "shared_cache": shared_cache.stats(),
+        "rate_limit": {
+            "store": type(rate_limiter.store).__name__,
+            "by_ip": rate_limiter.by_ip,
+            "limited": rate_limiter.limited,
+            "store_errors": rate_limiter.store_errors,
+        },
+        "caches": {
+            "auth": auth_cache.stats(),
+            "profile": {**profile_cache.stats(), "coalesced": profile_flight.coalesced},
+            "roles": role_registry.stats(),
+            "plan_catalog": plan_catalog.stats(),
+            "plans_response": plans_response_cache.stats(),
+            "roles_response": roles_response_cache.stats(),
+            "admin_stats": admin_stats.stats(),
+            "idempotency": idempotency_store.stats(),
+        },
     }
 
 
-@app.get("/api/roles", response_model=List[Role])
-async def get_roles():
-    if REST_BASE and SUPABASE_ANON_KEY:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            r = await client.get(f"{REST_BASE}/roles?select=*", headers=sb_headers())
-            r.raise_for_status()
-            items = r.json()
-            return [Role(id=str(x["id"]), name=x["name"]) for x in items] or [Role(name="client"), Role(name="admin")]
+@app.get("/api/ready")
+async def ready():
+    """Readiness probe: 200 once warm-up has finished and the reference tables are loaded."""
+    if not warmup.ready() and not warmup.running:
+        warmup.start()  # retry the failed steps; the next probe sees the result
+    body = warmup.stats()
+    return DefaultJSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 
-    if roles_collection is None:
-        return [Role(name="client"), Role(name="admin")]
+@app.get("/api/roles")
+async def get_roles(request: Request):
+    if storage.configured:
+        await role_registry.ensure_loaded()
+    # keyed by snapshot time so a registry refresh is picked up immediately
+    entry = await roles_response_cache.get_or_load(role_registry.loaded_at, _load_roles)
+    return cached_json_response(request, entry)
 
-    cursor = roles_collection.find({}, {"_id": 0})
-    out: List[Role] = []
-    async for doc in cursor:
-        rid = doc.get("id") or uuid4_str()
-        name = doc.get("name", "client")
-        out.append(Role(id=str(rid), name=name))
-    return out or [Role(name="client"), Role(name="admin")]
+
+async def _load_roles() -> List[Dict[str, Any]]:
+    roles = [Role(id=str(x["id"]), name=x["name"]) for x in role_registry.rows] or [Role(name="client"), Role(name="admin")]
+    return [role.model_dump() for role in roles]
+
+
+@app.get("/api/prices")
+async def get_prices(request: Request):
+    return cached_json_response(request, await price_feed.current())
 
 
 @app.post("/api/actions/echo")
@@ -224,56 +2697,66 @@ async def sync_time():
 
 
 # ============ Supabase Auth wrappers ============
-@app.post("/api/auth/register")
-async def supabase_register(payload: RegisterRequest):
-    if not (AUTH_BASE and SUPABASE_ANON_KEY and REST_BASE):
+@app.post("/api/auth/register", dependencies=[rate_limited("auth_register")])
+async def supabase_register(
+    payload: RegisterRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+):
+    if not (AUTH_BASE and SUPABASE_ANON_KEY and storage.configured):
         raise HTTPException(status_code=500, detail="Supabase not configured on backend")
+    scope = f"register:{payload.email.lower()}"
+    return await idempotent(request, response, scope, idempotency_key, payload, lambda: _register(payload, request))
+
+
+async def _register(payload: RegisterRequest, request: Request) -> Dict[str, Any]:
+    r = await sb_request(
+        "POST",
+        f"{AUTH_BASE}/signup",
+        kind="auth",
+        headers=sb_headers(),
+        json={
+            "email": payload.email,
+            "password": payload.password,
+            "data": {"full_name": payload.full_name or payload.email.split("@")[0]},
+        },
+    )
+    if r.status_code >= 300:
+        raise HTTPException(status_code=r.status_code, detail=r.text)
+    data = r.json()
+    user = (data or {}).get("user") or data
+    user_id = user.get("id") if user else None
+    if not user_id:
+        raise HTTPException(status_code=500, detail="Signup did not return user id")
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        r = await client.post(
-            f"{AUTH_BASE}/signup",
-            headers=sb_headers(),
-            json={
-                "email": payload.email,
-                "password": payload.password,
-                "data": {"full_name": payload.full_name or payload.email.split("@")[0]},
-            },
-        )
-        if r.status_code >= 300:
-            raise HTTPException(status_code=r.status_code, detail=r.text)
-        data = r.json()
-        user = (data or {}).get("user") or data
-        user_id = user.get("id") if user else None
-        if not user_id:
-            raise HTTPException(status_code=500, detail="Signup did not return user id")
-
-        await load_roles_cache()
-        client_role = _role_cache.get("client")
-        ins = await client.post(
-            f"{REST_BASE}/users",
-            headers=sb_headers(),
-            json=[{"id": user_id, "email": payload.email, "role_id": client_role}],
-        )
-        if ins.status_code >= 300:
-            raise HTTPException(status_code=ins.status_code, detail=ins.text)
+    await role_registry.ensure_loaded()
+    client_role = role_registry.id_for("client")
+    await storage.insert("users", [{"id": user_id, "email": payload.email, "role_id": client_role}], returning=False)
+    invalidate_user_profile(user_id)
+    audit_log.record("register", request, user_id=user_id, email=payload.email)
 
-        return {"user_id": user_id, "email": payload.email, "status": "registered"}
+    return {"user_id": user_id, "email": payload.email, "status": "registered"}
 
 
-@app.post("/api/auth/login")
-async def supabase_login(payload: LoginRequest):
+@app.post("/api/auth/login", dependencies=[rate_limited("auth_login")])
+async def supabase_login(payload: LoginRequest, request: Request):
     if not (AUTH_BASE and SUPABASE_ANON_KEY):
         raise HTTPException(status_code=500, detail="Supabase not configured on backend")
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        r = await client.post(
-            f"{AUTH_BASE}/token?grant_type=password",
-            headers=sb_headers(),
-            json={"email": payload.email, "password": payload.password},
-        )
-        if r.status_code >= 300:
-            raise HTTPException(status_code=r.status_code, detail=r.text)
-        return r.json()
+    r = await sb_request(
+        "POST",
+        f"{AUTH_BASE}/token?grant_type=password",
+        kind="auth",
+        headers=sb_headers(),
+        json={"email": payload.email, "password": payload.password},
+    )
+    if r.status_code >= 300:
+        audit_log.record("login_failed", request, email=payload.email, status=r.status_code)
+        raise HTTPException(status_code=r.status_code, detail=r.text)
+    data = r.json()
+    audit_log.record("login", request, user_id=((data or {}).get("user") or {}).get("id"), email=payload.email)
+    return data
 
 
 @app.get("/api/me")
@@ -285,90 +2768,469 @@ async def me(authorization: Optional[str] = Header(None)):
 
 # ============ Supabase domain endpoints ============
 @app.get("/api/plans")
-async def list_plans():
-    if not (REST_BASE and SUPABASE_ANON_KEY):
-        return []
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(f"{REST_BASE}/investment_plans?select=*", headers=sb_headers())
-        r.raise_for_status()
-        return r.json()
+async def list_plans(request: Request):
+    entry = await plans_response_cache.get_or_load("plans", _fetch_plans)
+    return cached_json_response(request, entry)
+
+
+async def _fetch_plans() -> List[Dict[str, Any]]:
+    await plan_catalog.refresh()
+    return plan_catalog.rows
 
 
-@app.post("/api/admin/plans")
-async def create_plan(plan: Dict[str, Any] = Body(...), authorization: Optional[str] = Header(None)):
+@app.post("/api/admin/plans", response_model=List[Plan])
+async def create_plan(
+    plan: PlanCreate,
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
     token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
-    _, role_name = await get_user_profile_with_role(token)
+    profile, role_name = await get_user_profile_with_role(token)
     if role_name != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
+    return await idempotent(request, response, profile["id"], idempotency_key, plan, lambda: _create_plan(plan, request, profile))
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.post(
-            f"{REST_BASE}/investment_plans",
-            headers=sb_headers(json=True),
-            json=[plan],
-        )
-        if r.status_code >= 300:
-            raise HTTPException(status_code=r.status_code, detail=r.text)
-        return r.json()
+
+async def _create_plan(plan: PlanCreate, request: Request, profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    rows = await storage.insert("investment_plans", [to_row(plan)])
+    shared_cache.publish("plans", rows)
+    audit_log.record("plan_created", request, user_id=profile["id"], plan_ids=[row.get("id") for row in rows], name=plan.name)
+    return rows
 
 
-@app.post("/api/user/investments")
-async def create_investment(data: Dict[str, Any] = Body(...), authorization: Optional[str] = Header(None)):
+@app.get("/api/admin/stats")
+async def get_admin_stats(authorization: Optional[str] = Header(None)):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    _, role_name = await get_user_profile_with_role(token)
+    if role_name != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if not storage.configured:
+        raise HTTPException(status_code=500, detail="Supabase not configured on backend")
+    return await admin_stats.get()
+
+
+@app.post("/api/admin/accrual/run")
+async def run_accrual(request: Request, authorization: Optional[str] = Header(None)):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    profile, role_name = await get_user_profile_with_role(token)
+    if role_name != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    result = await profit_accrual.run_once()
+    audit_log.record("accrual_run", request, user_id=profile["id"], **result)
+    return result
+
+
+@app.post("/api/admin/plans/bulk", dependencies=[rate_limited("bulk")])
+async def create_plans_bulk(
+    items: List[PlanCreate],
+    request: Request,
+    response: Response,
+    chunk_size: Optional[int] = None,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    profile, role_name = await get_user_profile_with_role(token)
+    if role_name != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    check_bulk_items(items)
+    return await idempotent(
+        request, response, profile["id"], idempotency_key, items, lambda: _create_plans_bulk(items, request, chunk_size, profile)
+    )
+
+
+async def _create_plans_bulk(
+    items: List[PlanCreate], request: Request, chunk_size: Optional[int], profile: Dict[str, Any]
+) -> Dict[str, Any]:
+    out = await bulk_insert("investment_plans", [to_row(item) for item in items], chunk_size)
+    if out["created"]:
+        shared_cache.publish("plans", [x["row"] for x in out["results"] if x["status"] == "created" and x["row"]])
+    audit_log.record("plans_bulk_created", request, user_id=profile["id"], created=out["created"], failed=out["failed"])
+    return out
+
+
+@app.post("/api/user/investments", response_model=List[Investment], dependencies=[rate_limited("investments_create")])
+async def create_investment(
+    data: InvestmentCreate,
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
     token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
     profile, _ = await get_user_profile_with_role(token)
-    data = dict(data)
-    data["user_id"] = profile["id"]  # ensure ownership
-
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.post(
-            f"{REST_BASE}/user_investments",
-            headers=sb_headers(json=True),
-            json=[data],
-        )
-        if r.status_code >= 300:
-            raise HTTPException(status_code=r.status_code, detail=r.text)
-        return r.json()
+    return await idempotent(request, response, profile["id"], idempotency_key, data, lambda: _create_investment(data, profile))
+
+
+async def investment_rows(items: List[InvestmentCreate], user_id: str) -> List[Dict[str, Any]]:
+    """Insert rows for active plans, with profit_target, start_date and end_date always set from the plan."""
+    await plan_catalog.ensure_plans([{"plan_id": item.plan_id} for item in items])
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i, item in enumerate(items):
+        where = "" if len(items) == 1 else f" in item {i}"
+        plan = plan_catalog.by_id.get(str(item.plan_id))
+        if plan is None or not plan.get("is_active", True):
+            raise HTTPException(status_code=422, detail=f"Unknown or inactive plan_id{where}")
+        low, high = plan.get("min_amount"), plan.get("max_amount")
+        if (low is not None and item.amount < Decimal(str(low))) or (high is not None and item.amount > Decimal(str(high))):
+            raise HTTPException(status_code=422, detail=f"amount is outside the plan's limits{where}")
+        rows.append(to_row(
+            item,
+            user_id=user_id,
+            profit_target=float(plan_profit_target(plan, item.amount)),
+            start_date=now.isoformat(),
+            end_date=(now + timedelta(days=int(plan["duration_days"]))).isoformat(),
+        ))
+    return rows
+
+
+async def _create_investment(data: InvestmentCreate, profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    rows = await storage.insert("user_investments", await investment_rows([data], profile["id"]))  # ensure ownership
+    admin_stats.bump("active_investments")
+    return rows
+
+
+@app.post("/api/user/investments/bulk", dependencies=[rate_limited("bulk")])
+async def create_investments_bulk(
+    items: List[InvestmentCreate],
+    request: Request,
+    response: Response,
+    chunk_size: Optional[int] = None,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    check_bulk_items(items)
+    profile, _ = await get_user_profile_with_role(token)
+    user_id = profile["id"]  # ensure ownership
+    return await idempotent(
+        request, response, user_id, idempotency_key, items, lambda: _create_investments_bulk(items, chunk_size, user_id)
+    )
+
+
+async def _create_investments_bulk(items: List[InvestmentCreate], chunk_size: Optional[int], user_id: str) -> Dict[str, Any]:
+    out = await bulk_insert("user_investments", await investment_rows(items, user_id), chunk_size)
+    admin_stats.bump("active_investments", out["created"])
+    return out
 
 
 @app.get("/api/user/my-investments")
-async def my_investments(authorization: Optional[str] = Header(None)):
+async def my_investments(
+    response: Response,
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    plan_id: Optional[uuid.UUID] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    authorization: Optional[str] = Header(None),
+):
     token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    check_choice("status", status, INVESTMENT_STATUSES)
+    select = select_columns(fields, INVESTMENT_COLUMNS, "*", extra=["plan_id"])
     profile, _ = await get_user_profile_with_role(token)
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(
-            f"{REST_BASE}/user_investments?select=*,plan:investment_plans(name)&user_id=eq.{profile['id']}",
-            headers=sb_headers(),
-        )
-        r.raise_for_status()
-        return r.json()
+    filters = [("user_id", f"eq.{profile['id']}")]
+    if status:
+        filters.append(("status", f"eq.{status}"))
+    if plan_id:
+        filters.append(("plan_id", f"eq.{plan_id}"))
+    filters += date_range_filters("created_at", date_from, date_to)
+    rows, next_cursor = await fetch_keyset_page("user_investments", select, filters, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return await plan_catalog.hydrate(rows)
+
+
+@app.post("/api/user/transactions", response_model=List[Transaction], dependencies=[rate_limited("transactions_create")])
+async def create_transaction(
+    data: TransactionCreate,
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    profile, _ = await get_user_profile_with_role(token)
+    return await idempotent(
+        request, response, profile["id"], idempotency_key, data, lambda: _create_transaction(data, request, profile)
+    )
+
+
+async def _create_transaction(data: TransactionCreate, request: Request, profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    rows = await storage.insert("transactions", await transaction_rows([data], profile["id"]))
+    admin_stats.bump("pending_transactions")
+    for row in rows:
+        publish_transaction(row)
+    audit_log.record(
+        "transaction_created",
+        request,
+        user_id=profile["id"],
+        transaction_ids=[row.get("id") for row in rows],
+        type=data.type.value,
+        crypto_type=data.crypto_type,
+        amount=str(data.amount),
+        usd_value=[row.get("usd_value") for row in rows],
+    )
+    return rows
+
+
+@app.post("/api/user/transactions/bulk", dependencies=[rate_limited("bulk")])
+async def create_transactions_bulk(
+    items: List[TransactionCreate],
+    request: Request,
+    response: Response,
+    chunk_size: Optional[int] = None,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    check_bulk_items(items)
+    profile, _ = await get_user_profile_with_role(token)
+    user_id = profile["id"]
+    return await idempotent(
+        request, response, user_id, idempotency_key, items, lambda: _create_transactions_bulk(items, request, chunk_size, user_id)
+    )
+
 
+async def _create_transactions_bulk(
+    items: List[TransactionCreate], request: Request, chunk_size: Optional[int], user_id: str
+) -> Dict[str, Any]:
+    out = await bulk_insert("transactions", await transaction_rows(items, user_id), chunk_size)
+    admin_stats.bump("pending_transactions", out["created"])
+    audit_log.record("transactions_bulk_created", request, user_id=user_id, created=out["created"], failed=out["failed"])
+    return out
 
-@app.post("/api/user/transactions")
-async def create_transaction(data: Dict[str, Any] = Body(...), authorization: Optional[str] = Header(None)):
+
+@app.get("/api/user/my-transactions")
+async def my_transactions(
+    response: Response,
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    authorization: Optional[str] = Header(None),
+):
     token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    filters = transaction_filters(status, type, date_from, date_to)
+    select = select_columns(fields, TRANSACTION_COLUMNS, "id,type,amount,status,created_at")
     profile, _ = await get_user_profile_with_role(token)
-    data = dict(data)
-    data["user_id"] = profile["id"]
-
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.post(
-            f"{REST_BASE}/transactions",
-            headers=sb_headers(json=True),
-            json=[data],
-        )
-        if r.status_code >= 300:
-            raise HTTPException(status_code=r.status_code, detail=r.text)
-        return r.json()
+    # user_id/status/type filters are pushed down so PostgREST can use idx_transactions_*
+    filters.insert(0, ("user_id", f"eq.{profile['id']}"))
+    rows, next_cursor = await fetch_keyset_page("transactions", select, filters, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return rows
 
 
-@app.get("/api/user/my-transactions")
-async def my_transactions(authorization: Optional[str] = Header(None)):
+@app.post("/api/user/events/ticket")
+async def user_events_ticket(authorization: Optional[str] = Header(None)):
     token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
     profile, _ = await get_user_profile_with_role(token)
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(
-            f"{REST_BASE}/transactions?select=id,type,amount,status,created_at&user_id=eq.{profile['id']}",
-            headers=sb_headers(),
-        )
-        r.raise_for_status()
-        return r.json()
\ No newline at end of file
+    return {"ticket": await stream_tickets.issue(profile["id"]), "expires_in": EVENTS_TICKET_TTL}
+
+
+@app.get("/api/user/events")
+async def user_events(request: Request, ticket: Optional[str] = None, authorization: Optional[str] = Header(None)):
+    # EventSource cannot set headers: browsers POST /api/user/events/ticket first and pass ?ticket=
+    if ticket is not None:
+        user_id = await stream_tickets.redeem(ticket)
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    else:
+        token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+        profile, _ = await get_user_profile_with_role(token)
+        user_id = profile["id"]
+
+    async def stream() -> AsyncIterator[bytes]:
+        queue = event_hub.subscribe(user_id)
+        try:
+            yield b"retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    seq, event, data = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                yield sse_message(seq, event, data)
+        finally:
+            event_hub.unsubscribe(user_id, queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+
+DASHBOARD_RECENT_TRANSACTIONS = _env_int("DASHBOARD_RECENT_TRANSACTIONS", 10)
+
+
+def _sum_decimal(rows: Iterable[Dict[str, Any]], column: str) -> float:
+    return float(sum((Decimal(str(row.get(column) or 0)) for row in rows), Decimal(0)))
+
+
+@app.get("/api/user/dashboard")
+async def user_dashboard(authorization: Optional[str] = Header(None)):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    profile, role_name = await get_user_profile_with_role(token)
+    user_filter = f"eq.{profile['id']}"
+
+    investments, recent, pending, plans = await asyncio.gather(
+        storage.select("user_investments", [("user_id", user_filter)], order="created_at.desc"),
+        storage.select(
+            "transactions",
+            [("user_id", user_filter)],
+            "id,type,crypto_type,amount,usd_value,status,created_at",
+            order="created_at.desc,id.desc",
+            limit=DASHBOARD_RECENT_TRANSACTIONS,
+        ),
+        storage.select("transactions", [("user_id", user_filter), ("status", "eq.pending")], "type,usd_value"),
+        plans_response_cache.get_or_load("plans", _fetch_plans),
+    )
+    await plan_catalog.hydrate(investments)
+    active = [x for x in investments if x.get("status") == "active"]
+    return {
+        "user": {"id": profile["id"], "email": profile["email"], "role": role_name},
+        "totals": {
+            "invested": _sum_decimal(active, "amount"),
+            "current_profit": _sum_decimal(investments, "current_profit"),
+            "active_investments": len(active),
+            "pending_deposits": _sum_decimal([x for x in pending if x.get("type") == "deposit"], "usd_value"),
+            "pending_withdrawals": _sum_decimal([x for x in pending if x.get("type") == "withdrawal"], "usd_value"),
+            "pending_transactions": len(pending),
+        },
+        "investments": investments,
+        "recent_transactions": recent,
+        "plans": plans.data,
+    }
+
+
+@app.get("/api/user/transactions/export", dependencies=[rate_limited("export")])
+async def export_my_transactions(
+    request: Request,
+    format: str = "ndjson",
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    authorization: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    filters = transaction_filters(status, type, date_from, date_to)
+    profile, _ = await get_user_profile_with_role(token)
+    filters.insert(0, ("user_id", f"eq.{profile['id']}"))
+    return export_response(request, filters, format, "transactions")
+
+
+@app.get("/api/admin/transactions/export", dependencies=[rate_limited("export")])
+async def export_all_transactions(
+    request: Request,
+    format: str = "ndjson",
+    user_id: Optional[uuid.UUID] = None,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    authorization: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    _, role_name = await get_user_profile_with_role(token)
+    if role_name != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    filters = transaction_filters(status, type, date_from, date_to)
+    if user_id:
+        filters.insert(0, ("user_id", f"eq.{user_id}"))
+    # read with the admin's token: under RLS the anon key only sees its own (no) rows
+    return export_response(request, filters, format, "transactions-all", bearer=token)
+
+
+@app.get("/api/admin/transactions/pending")
+async def pending_transactions(
+    response: Response,
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    type: Optional[str] = None,
+    user_id: Optional[uuid.UUID] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    authorization: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    # status=eq.pending goes first so PostgREST can use idx_transactions_status(_created)
+    filters = transaction_filters("pending", type, date_from, date_to)
+    if user_id:
+        filters.append(("user_id", f"eq.{user_id}"))
+    select = select_columns(
+        fields, TRANSACTION_COLUMNS, "id,user_id,type,crypto_type,amount,usd_value,fee_amount,wallet_address,transaction_hash,created_at"
+    )
+    _, role_name = await get_user_profile_with_role(token)
+    if role_name != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    rows, next_cursor = await fetch_keyset_page("transactions", select, filters, limit, cursor, bearer=token)
+    set_next_cursor(response, next_cursor)
+    return rows
+
+
+@app.post("/api/admin/transactions/decide", dependencies=[rate_limited("bulk")])
+async def decide_transactions(
+    data: TransactionDecision,
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    token = require_bearer(authorization.replace("Bearer ", "") if authorization else None)
+    if len(data.ids) > REVIEW_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {REVIEW_MAX_IDS} ids per request")
+    profile, role_name = await get_user_profile_with_role(token)
+    if role_name != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    return await idempotent(
+        request, response, profile["id"], idempotency_key, data, lambda: _decide_transactions(data, request, profile, token)
+    )
+
+
+async def _decide_transactions(
+    data: TransactionDecision, request: Request, profile: Dict[str, Any], token: str
+) -> Dict[str, Any]:
+    ids = list(dict.fromkeys(str(i) for i in data.ids))
+    rows = await storage.decide_transactions(ids, data.decision.value, data.admin_note, bearer=token)
+    decided = {str(row["id"]) for row in rows}
+    skipped = [i for i in ids if i not in decided]  # unknown or no longer pending
+    admin_stats.bump("pending_transactions", -len(rows))
+    for row in rows:
+        publish_transaction(row)
+    audit_log.record(
+        "transactions_decided",
+        request,
+        user_id=profile["id"],
+        decision=data.decision.value,
+        transaction_ids=sorted(decided),
+        skipped=len(skipped),
+    )
+    return {"decided": len(rows), "skipped": skipped, "transactions": rows}
+
+
+# -------- Entry point --------
+# `python server.py` runs uvicorn with WEB_CONCURRENCY worker processes; gunicorn.conf.py does the same
+# under gunicorn. Each worker has its own in-process caches, so with more than one worker set CACHE_URL
+# and RATE_LIMIT_STORE_URL to a shared Redis-compatible server. X-Forwarded-For is honoured only from
+# FORWARDED_ALLOW_IPS (the ingress/load balancer addresses, comma-separated; default 127.0.0.1).
+# With several workers profit accrual is off unless ACCRUAL_INTERVAL is set, as in gunicorn.conf.py.
+if __name__ == "__main__":
+    import uvicorn
+
+    workers = _env_int("WEB_CONCURRENCY", 1)
+    if workers > 1:
+        os.environ.setdefault("ACCRUAL_INTERVAL", "0")  # inherited by the worker processes
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=_env_int("PORT", 8001),
+        workers=workers,
+        proxy_headers=True,
+        forwarded_allow_ips=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    )
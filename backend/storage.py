@@ -0,0 +1,605 @@
+"""Storage backends for the API: Supabase (PostgREST), in-memory and MongoDB.
+
+Filters and ordering use PostgREST notation, e.g. [("status", "eq.pending")] and "created_at.desc,id.desc";
+each backend interprets the subset the API uses: eq, neq, gt, gte, lt, lte, in.(...), is.null/true/false.
+"""
+import abc
+import asyncio
+import bisect
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+Keyset = Tuple[str, str]  # (created_at, id) of the last row already returned
+
+
+def parse_filter(expr: str) -> Tuple[str, Any]:
+    op, _, operand = expr.partition(".")
+    if op == "in":
+        return op, [v.strip().strip('"') for v in operand.strip("()").split(",") if v.strip()]
+    if op == "is":
+        return op, {"null": None, "true": True, "false": False}.get(operand.lower(), operand)
+    if op not in ("eq", "neq", "gt", "gte", "lt", "lte"):
+        raise ValueError(f"Unsupported filter operator: {op}")
+    return op, operand.strip('"')
+
+
+def parse_order(order: Optional[str]) -> List[Tuple[str, bool]]:
+    """[(column, descending)] from `col.desc,col2.asc`."""
+    out = []
+    for part in (order or "").split(","):
+        if part:
+            column, _, direction = part.partition(".")
+            out.append((column, direction == "desc"))
+    return out
+
+
+# -------- Transaction review --------
+# (type, status) -> notification title, message and type, in the language of the app
+REVIEW_NOTIFICATIONS = {
+    ("deposit", "approved"): ("Dépôt approuvé", "Votre dépôt de {amount} {crypto_type} ({usd_value} €) a été validé.", "success"),
+    ("deposit", "rejected"): ("Dépôt refusé", "Votre dépôt de {amount} {crypto_type} a été refusé.", "error"),
+    ("withdrawal", "approved"): ("Retrait approuvé", "Votre retrait de {amount} {crypto_type} ({usd_value} €) a été validé.", "success"),
+    ("withdrawal", "rejected"): ("Retrait refusé", "Votre retrait de {amount} {crypto_type} a été refusé.", "error"),
+}
+
+
+def balance_deltas(rows: List[Dict[str, Any]]) -> Dict[str, float]:
+    """users.total_invested change per user: approved deposits add their usd_value, approved withdrawals subtract it.
+    Storage engines clamp the resulting total at 0, so a withdrawal above the balance empties it."""
+    deltas: Dict[str, Decimal] = {}
+    for row in rows:
+        if row.get("status") != "approved":
+            continue
+        value = Decimal(str(row.get("usd_value") or 0))
+        user_id = str(row["user_id"])
+        deltas[user_id] = deltas.get(user_id, Decimal(0)) + (value if row.get("type") == "deposit" else -value)
+    return {user_id: float(delta) for user_id, delta in deltas.items() if delta}
+
+
+def review_notifications(rows: List[Dict[str, Any]], admin_note: Optional[str]) -> List[Dict[str, Any]]:
+    out = []
+    for row in rows:
+        title, message, kind = REVIEW_NOTIFICATIONS[(row["type"], row["status"])]
+        message = message.format(
+            amount=row.get("amount"), crypto_type=row.get("crypto_type"), usd_value=f"{float(row.get('usd_value') or 0):.2f}"
+        )
+        if admin_note:
+            message += f" Note : {admin_note}"
+        out.append({"user_id": row["user_id"], "title": title, "message": message, "type": kind})
+    return out
+
+
+# -------- Backends --------
+class Storage(abc.ABC):
+    """Row store for the tables the API reads and writes; rows go in and come out JSON-ready."""
+
+    name = "base"
+    TIMESTAMPS = {
+        "users": ("created_at", "updated_at"),
+        "transactions": ("created_at", "updated_at"),
+        "user_investments": ("created_at", "start_date"),
+    }
+    DEFAULTS: Dict[str, Dict[str, Any]] = {
+        "users": {"status": "active", "total_invested": 0, "total_profit": 0},
+        "investment_plans": {"is_active": True},
+        "user_investments": {"status": "active", "current_profit": 0},
+        "transactions": {"status": "pending"},
+        "notifications": {"is_read": False},
+    }
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    def new_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the column defaults the Postgres schema would."""
+        now = datetime.now(timezone.utc).isoformat()
+        stamps = {column: now for column in self.TIMESTAMPS.get(table, ("created_at",))}
+        return {"id": str(uuid.uuid4()), **stamps, **self.DEFAULTS.get(table, {}), **row}
+
+    async def prepare(self) -> None:
+        pass
+
+    async def ping(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def select(
+        self,
+        table: str,
+        filters: Iterable[Tuple[str, str]] = (),
+        columns: str = "*",
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+        before: Optional[Keyset] = None,
+        hedge: bool = False,
+        bearer: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """`bearer` reads as that user (on Supabase, so RLS lets admins see every row); engines without RLS ignore it."""
+        ...
+
+    @abc.abstractmethod
+    async def insert(self, table: str, rows: List[Dict[str, Any]], returning: bool = True) -> List[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    async def update(self, table: str, filters: Iterable[Tuple[str, str]], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    async def apply_accrual(self, updates: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Set current_profit and status per investment id in one round trip, only where the row is still active;
+        {updated, completed}: how many rows were written and how many of those were completed."""
+        ...
+
+    @abc.abstractmethod
+    async def decide_transactions(
+        self, ids: List[str], decision: str, admin_note: Optional[str], bearer: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Decide the still-pending `ids` together with their balance changes and notifications; the decided rows."""
+        ...
+
+    @abc.abstractmethod
+    async def dashboard_stats(self) -> Dict[str, Any]:
+        ...
+
+
+class SupabaseStorage(Storage):
+    """PostgREST tables and RPCs. `request` and `headers` are the server's pooled, breaker-guarded
+    Supabase call and its header builder (anon key, or the given user's bearer)."""
+
+    name = "supabase"
+
+    def __init__(
+        self,
+        rest_base: Optional[str],
+        api_key: Optional[str],
+        request: Callable[..., Awaitable[httpx.Response]],
+        headers: Callable[..., Dict[str, str]],
+    ):
+        self.rest_base = rest_base
+        self.api_key = api_key
+        self.request = request
+        self.headers = headers
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.rest_base and self.api_key)
+
+    async def ping(self) -> None:
+        if not self.configured:
+            raise RuntimeError("SUPABASE_URL / SUPABASE_ANON_KEY not configured")
+
+    async def select(
+        self,
+        table: str,
+        filters: Iterable[Tuple[str, str]] = (),
+        columns: str = "*",
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+        before: Optional[Keyset] = None,
+        hedge: bool = False,
+        bearer: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        params = [("select", columns), *filters]
+        if order:
+            params.append(("order", order))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        if before:
+            created_at, row_id = before
+            params.append(("or", f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id}))'))
+        r = await self.request("GET", f"{self.rest_base}/{table}", hedge=hedge, headers=self.headers(bearer), params=params)
+        r.raise_for_status()
+        return r.json()
+
+    async def insert(self, table: str, rows: List[Dict[str, Any]], returning: bool = True) -> List[Dict[str, Any]]:
+        prefer = "return=representation" if returning else "return=minimal"
+        r = await self.request("POST", f"{self.rest_base}/{table}", kind="write", headers={**self.headers(), "Prefer": prefer}, json=rows)
+        if r.status_code >= 300:
+            raise HTTPException(status_code=r.status_code, detail=r.text)
+        return r.json() if returning and r.content else []
+
+    async def update(self, table: str, filters: Iterable[Tuple[str, str]], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        r = await self.request(
+            "PATCH",
+            f"{self.rest_base}/{table}",
+            kind="write",
+            headers={**self.headers(), "Prefer": "return=representation"},
+            params=list(filters),
+            json=values,
+        )
+        if r.status_code >= 300:
+            raise HTTPException(status_code=r.status_code, detail=r.text)
+        return r.json() if r.content else []
+
+    async def apply_accrual(self, updates: List[Dict[str, Any]]) -> Dict[str, int]:
+        r = await self.request(
+            "POST",
+            f"{self.rest_base}/rpc/apply_accrual",
+            kind="write",
+            headers=self.headers(),
+            json={"updates": updates},
+        )
+        if r.status_code >= 300:
+            raise HTTPException(status_code=r.status_code, detail=r.text)
+        return r.json()
+
+    async def decide_transactions(
+        self, ids: List[str], decision: str, admin_note: Optional[str], bearer: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        r = await self.request(
+            "POST",
+            f"{self.rest_base}/rpc/decide_transactions",
+            kind="write",
+            headers=self.headers(bearer),
+            json={"transaction_ids": ids, "decision": decision, "note": admin_note},
+        )
+        if r.status_code >= 300:
+            raise HTTPException(status_code=r.status_code, detail=r.text)
+        return r.json()
+
+    async def dashboard_stats(self) -> Dict[str, Any]:
+        r = await self.request("POST", f"{self.rest_base}/rpc/get_dashboard_stats", headers=self.headers(), json={})
+        r.raise_for_status()
+        return r.json() or {}
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    if op == "is":
+        return value is operand if operand is None or isinstance(operand, bool) else str(value) == str(operand)
+    if value is None:
+        return op == "neq"
+    if op == "in":
+        return str(value) in operand
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            left, right = value, float(operand)
+        except ValueError:
+            left, right = str(value), operand
+    else:
+        left, right = (str(value).lower(), operand.lower()) if isinstance(value, bool) else (str(value), operand)
+    if op == "eq":
+        return left == right
+    if op == "neq":
+        return left != right
+    if op == "gt":
+        return left > right
+    if op == "gte":
+        return left >= right
+    if op == "lt":
+        return left < right
+    return left <= right
+
+
+class MemoryStorage(Storage):
+    """Process-local tables with hash indexes on id/user_id/status and a sorted (created_at, id) index,
+    for load tests and single-process runs."""
+
+    name = "memory"
+    INDEXED = ("id", "user_id", "status")
+    KEYSET_ORDER = "created_at.desc,id.desc"
+
+    def __init__(self) -> None:
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.indexes: Dict[str, Dict[str, Dict[Any, Set[str]]]] = {}
+        self.keysets: Dict[str, List[Tuple[str, str]]] = {}  # ascending (created_at, id)
+        self._rows("roles")
+        for name in ("admin", "client"):
+            self._add("roles", self.new_row("roles", {"name": name}))
+
+    def _rows(self, table: str) -> Dict[str, Dict[str, Any]]:
+        if table not in self.tables:
+            self.tables[table] = {}
+            self.indexes[table] = {column: {} for column in self.INDEXED}
+            self.keysets[table] = []
+        return self.tables[table]
+
+    def _add(self, table: str, row: Dict[str, Any]) -> None:
+        row_id = str(row["id"])
+        rows = self._rows(table)
+        if row_id not in rows:
+            bisect.insort(self.keysets[table], (str(row.get("created_at")), row_id))
+        rows[row_id] = row
+        for column, index in self.indexes[table].items():
+            index.setdefault(row.get(column), set()).add(row_id)
+
+    def _apply(self, table: str, row: Dict[str, Any], values: Dict[str, Any]) -> None:
+        """Update a stored row in place, moving it between index buckets only for columns that change."""
+        row_id = str(row["id"])
+        for column, index in self.indexes[table].items():
+            if column in values and values[column] != row.get(column):
+                ids = index.get(row.get(column))
+                if ids is not None:
+                    ids.discard(row_id)
+                    if not ids:
+                        del index[row.get(column)]
+                index.setdefault(values[column], set()).add(row_id)
+        row.update(values)
+
+    def _candidates(self, table: str, parsed: List[Tuple[str, str, Any]]) -> Optional[Set[str]]:
+        """Ids allowed by the indexed eq/in filters, or None when no filter can use an index."""
+        candidates: Optional[Set[str]] = None
+        for column, op, operand in parsed:
+            index = self.indexes[table].get(column)
+            if index is None or op not in ("eq", "in"):
+                continue
+            # the index's own set for eq (read-only here), a fresh union for in
+            ids = index.get(operand, set()) if op == "eq" else set().union(*(index.get(v, ()) for v in operand))
+            candidates = ids if candidates is None else candidates & ids
+        return candidates
+
+    def _match(self, table: str, filters: Iterable[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        rows = self._rows(table)
+        parsed = [(column, *parse_filter(expr)) for column, expr in filters]
+        candidates = self._candidates(table, parsed)
+        pool = rows.values() if candidates is None else (rows[i] for i in candidates)
+        return [row for row in pool if all(_compare(row.get(c), op, operand) for c, op, operand in parsed)]
+
+    def _keyset_page(
+        self, table: str, filters: Iterable[Tuple[str, str]], limit: int, before: Optional[Keyset]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Walk the sorted index newest-first from `before`; None when indexed filters leave few enough rows to sort."""
+        rows, keys = self._rows(table), self.keysets[table]
+        parsed = [(column, *parse_filter(expr)) for column, expr in filters]
+        candidates = self._candidates(table, parsed)
+        if candidates is not None and len(candidates) * 8 < len(keys):
+            return None
+        out: List[Dict[str, Any]] = []
+        for i in range(bisect.bisect_left(keys, tuple(before)) if before else len(keys), 0, -1):
+            row_id = keys[i - 1][1]
+            if candidates is not None and row_id not in candidates:
+                continue
+            row = rows[row_id]
+            if all(_compare(row.get(c), op, operand) for c, op, operand in parsed):
+                out.append(row)
+                if len(out) >= limit:
+                    break
+        return out
+
+    async def select(
+        self,
+        table: str,
+        filters: Iterable[Tuple[str, str]] = (),
+        columns: str = "*",
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+        before: Optional[Keyset] = None,
+        hedge: bool = False,
+        bearer: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        page = self._keyset_page(table, filters, limit, before) if order == self.KEYSET_ORDER and limit is not None else None
+        if page is not None:
+            rows = page
+        else:
+            rows = self._match(table, filters)
+            if before:
+                rows = [row for row in rows if (str(row.get("created_at")), str(row["id"])) < tuple(before)]
+            for column, descending in reversed(parse_order(order)):
+                rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=descending)
+            if limit is not None:
+                rows = rows[:limit]
+        if columns == "*":
+            return [dict(row) for row in rows]
+        keep = [c.strip() for c in columns.split(",")]
+        return [{c: row.get(c) for c in keep} for row in rows]
+
+    async def insert(self, table: str, rows: List[Dict[str, Any]], returning: bool = True) -> List[Dict[str, Any]]:
+        created = [self.new_row(table, row) for row in rows]
+        existing = self._rows(table)
+        if any(str(row["id"]) in existing for row in created):
+            raise HTTPException(status_code=409, detail=f"duplicate key value violates unique constraint on {table}.id")
+        for row in created:
+            self._add(table, row)
+        return [dict(row) for row in created] if returning else []
+
+    async def update(self, table: str, filters: Iterable[Tuple[str, str]], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        out = []
+        stamp = {"updated_at": datetime.now(timezone.utc).isoformat()} if "updated_at" in self.TIMESTAMPS.get(table, ()) else {}
+        for row in self._match(table, filters):
+            self._apply(table, row, {**values, **stamp})
+            out.append(dict(row))
+        return out
+
+    async def apply_accrual(self, updates: List[Dict[str, Any]]) -> Dict[str, int]:
+        existing = self._rows("user_investments")
+        applied = {"updated": 0, "completed": 0}
+        for update in updates:
+            row = existing.get(str(update["id"]))
+            if row is not None and row.get("status") == "active":
+                self._apply("user_investments", row, {"current_profit": update["current_profit"], "status": update["status"]})
+                applied["updated"] += 1
+                applied["completed"] += update["status"] == "completed"
+        return applied
+
+    async def decide_transactions(
+        self, ids: List[str], decision: str, admin_note: Optional[str], bearer: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        values: Dict[str, Any] = {"status": decision, "updated_at": datetime.now(timezone.utc).isoformat()}
+        if admin_note is not None:
+            values["admin_note"] = admin_note
+        existing = self._rows("transactions")
+        rows = []
+        for row_id in ids:
+            row = existing.get(str(row_id))
+            if row is not None and row.get("status") == "pending":
+                self._apply("transactions", row, values)
+                rows.append(dict(row))
+        users = self._rows("users")
+        for user_id, delta in balance_deltas(rows).items():
+            user = users.get(user_id)
+            if user is not None:
+                total = float(max(Decimal(str(user.get("total_invested") or 0)) + Decimal(str(delta)), Decimal(0)))
+                self._apply("users", user, {"total_invested": total, "updated_at": values["updated_at"]})
+        for row in review_notifications(rows, admin_note):
+            self._add("notifications", self.new_row("notifications", row))
+        return rows
+
+    async def dashboard_stats(self) -> Dict[str, Any]:
+        users = list(self._rows("users").values())
+        week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+        active = [u for u in users if u.get("status") == "active"]
+        return {
+            "total_users": len(active),
+            "active_users": sum(1 for u in active if str(u.get("updated_at") or "") > week_ago),
+            "total_capital": sum(float(u.get("total_invested") or 0) for u in users),
+            "active_investments": len(self.indexes["user_investments"]["status"].get("active", ())) if "user_investments" in self.tables else 0,
+            "pending_transactions": len(self.indexes["transactions"]["status"].get("pending", ())) if "transactions" in self.tables else 0,
+            "total_profit": sum(float(u.get("total_profit") or 0) for u in users),
+            "monthly_growth": 0,
+            "weekly_growth": 0,
+        }
+
+
+class MongoStorage(Storage):
+    """Motor-backed tables, one collection per table keyed by the `id` column."""
+
+    name = "mongo"
+    OPERATORS = {"eq": "$eq", "neq": "$ne", "gt": "$gt", "gte": "$gte", "lt": "$lt", "lte": "$lte", "in": "$in", "is": "$eq"}
+
+    def __init__(self, url: str, db_name: str):
+        from motor.motor_asyncio import AsyncIOMotorClient  # optional dependency, only needed for this backend
+
+        self.client = AsyncIOMotorClient(url)
+        self.db = self.client[db_name]
+
+    @staticmethod
+    def query(filters: Iterable[Tuple[str, str]], before: Optional[Keyset] = None) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for column, expr in filters:
+            op, operand = parse_filter(expr)
+            out.setdefault(column, {})[MongoStorage.OPERATORS[op]] = operand
+        if before:
+            created_at, row_id = before
+            out["$or"] = [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "id": {"$lt": row_id}}]
+        return out
+
+    async def prepare(self) -> None:
+        for table in ("users", "investment_plans", "user_investments", "transactions", "notifications"):
+            await self.db[table].create_index("id", unique=True)
+            if table not in ("users", "investment_plans"):
+                await self.db[table].create_index([("user_id", 1), ("created_at", -1), ("id", -1)])
+        await self.db["transactions"].create_index([("status", 1), ("created_at", -1)])
+        await self.db["user_investments"].create_index("status")
+        if await self.db["roles"].count_documents({}) == 0:
+            await self.db["roles"].insert_many([self.new_row("roles", {"name": name}) for name in ("admin", "client")])
+
+    async def ping(self) -> None:
+        await self.db.command("ping")
+
+    async def select(
+        self,
+        table: str,
+        filters: Iterable[Tuple[str, str]] = (),
+        columns: str = "*",
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+        before: Optional[Keyset] = None,
+        hedge: bool = False,
+        bearer: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        projection = {"_id": 0}
+        if columns != "*":
+            projection.update({c.strip(): 1 for c in columns.split(",")})
+        cursor = self.db[table].find(self.query(filters, before), projection)
+        sort = [(column, -1 if descending else 1) for column, descending in parse_order(order)]
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def insert(self, table: str, rows: List[Dict[str, Any]], returning: bool = True) -> List[Dict[str, Any]]:
+        created = [self.new_row(table, row) for row in rows]
+        await self.db[table].insert_many([dict(row) for row in created])  # insert_many adds _id to the docs it gets
+        return created if returning else []
+
+    async def update(self, table: str, filters: Iterable[Tuple[str, str]], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        ids = [row["id"] for row in await self.select(table, filters, "id")]
+        if not ids:
+            return []
+        if "updated_at" in self.TIMESTAMPS.get(table, ()):
+            values = {**values, "updated_at": datetime.now(timezone.utc).isoformat()}
+        await self.db[table].update_many({"id": {"$in": ids}}, {"$set": values})
+        return await self.select(table, [("id", f"in.({','.join(map(str, ids))})")])
+
+    async def apply_accrual(self, updates: List[Dict[str, Any]]) -> Dict[str, int]:
+        from pymongo import UpdateOne  # ships with motor
+
+        async def write(batch: List[Dict[str, Any]]) -> int:
+            if not batch:
+                return 0
+            result = await self.db["user_investments"].bulk_write(
+                [
+                    UpdateOne(
+                        {"id": update["id"], "status": "active"},
+                        {"$set": {"current_profit": update["current_profit"], "status": update["status"]}},
+                    )
+                    for update in batch
+                ],
+                ordered=False,
+            )
+            return result.modified_count
+
+        # completions go in their own bulk write so the number actually completed is known
+        advanced, completed = await asyncio.gather(
+            write([u for u in updates if u["status"] != "completed"]),
+            write([u for u in updates if u["status"] == "completed"]),
+        )
+        return {"updated": advanced + completed, "completed": completed}
+
+    async def decide_transactions(
+        self, ids: List[str], decision: str, admin_note: Optional[str], bearer: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        from pymongo import ReturnDocument, UpdateOne
+
+        # Without a replica set there are no multi-document transactions: each transaction is claimed
+        # atomically (pending -> decided) and the follow-up writes are unordered bulk operations.
+        values: Dict[str, Any] = {"status": decision, "updated_at": datetime.now(timezone.utc).isoformat()}
+        if admin_note is not None:
+            values["admin_note"] = admin_note
+        rows = []
+        for row_id in ids:
+            row = await self.db["transactions"].find_one_and_update(
+                {"id": row_id, "status": "pending"}, {"$set": values}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+            )
+            if row is not None:
+                rows.append(row)
+        deltas = balance_deltas(rows)
+        if deltas:
+            await self.db["users"].bulk_write(
+                [
+                    # pipeline update (MongoDB 4.2+): add the delta and clamp at 0 in one atomic write
+                    UpdateOne(
+                        {"id": user_id},
+                        [{"$set": {"total_invested": {"$max": [{"$add": [{"$ifNull": ["$total_invested", 0]}, delta]}, 0]}}}],
+                    )
+                    for user_id, delta in deltas.items()
+                ],
+                ordered=False,
+            )
+        if rows:
+            await self.insert("notifications", review_notifications(rows, admin_note), returning=False)
+        return rows
+
+    async def dashboard_stats(self) -> Dict[str, Any]:
+        week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+        sums = await self.db["users"].aggregate([
+            {"$group": {"_id": None, "capital": {"$sum": "$total_invested"}, "profit": {"$sum": "$total_profit"}}},
+        ]).to_list(length=1)
+        totals = sums[0] if sums else {}
+        return {
+            "total_users": await self.db["users"].count_documents({"status": "active"}),
+            "active_users": await self.db["users"].count_documents({"status": "active", "updated_at": {"$gt": week_ago}}),
+            "total_capital": totals.get("capital", 0),
+            "active_investments": await self.db["user_investments"].count_documents({"status": "active"}),
+            "pending_transactions": await self.db["transactions"].count_documents({"status": "pending"}),
+            "total_profit": totals.get("profit", 0),
+            "monthly_growth": 0,
+            "weekly_growth": 0,
+        }
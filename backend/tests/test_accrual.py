@@ -0,0 +1,113 @@
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+NOW = datetime(2026, 1, 31, 12, 0, tzinfo=timezone.utc)
+
+
+def investment(start_days_ago: float, target: float, current: float = 0, amount: float = 1000) -> dict:
+    start = NOW - timedelta(days=start_days_ago)
+    return {
+        "id": f"inv-{start_days_ago}-{target}-{current}",
+        "created_at": start.isoformat(),
+        "start_date": start.isoformat(),
+        "end_date": None,
+        "amount": amount,
+        "profit_target": target,
+        "current_profit": current,
+        "status": "active",
+    }
+
+
+def plan(duration_days, percent: float = 100) -> dict:
+    return {"profit_target": percent, "duration_days": duration_days}
+
+
+@pytest.fixture(params=[False, True], ids=["loop", "numpy"])
+def vectorize(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numpy")
+    monkeypatch.setattr(server, "ACCRUAL_VECTORIZE", request.param)
+    return request.param
+
+
+def test_accrues_elapsed_share_rounded_down(vectorize):
+    changes = server.accrue_batch([investment(10, 300.0)], [plan(30)], NOW)
+    assert changes == [{"id": "inv-10-300.0-0", "current_profit": 100.0, "status": "active"}]
+
+    changes = server.accrue_batch([investment(1, 100.0)], [plan(3)], NOW)
+    assert changes[0]["current_profit"] == 33.33
+
+
+def test_matured_rows_complete_at_target(vectorize):
+    changes = server.accrue_batch([investment(31, 123.45)], [plan(30)], NOW)
+    assert [(c["current_profit"], c["status"]) for c in changes] == [(123.45, "completed")]
+
+
+def test_term_comes_from_the_plan_not_end_date(vectorize):
+    row = investment(5, 50.0)
+    row["end_date"] = (NOW - timedelta(hours=1)).isoformat()
+    assert server.accrue_batch([row], [plan(10)], NOW) == [{"id": row["id"], "current_profit": 25.0, "status": "active"}]
+
+
+def test_target_is_capped_by_the_plan(vectorize):
+    # a stored profit_target above what the plan pays on the amount is never credited
+    row = investment(31, 1_000_000.0, amount=200)
+    assert server.accrue_batch([row], [plan(30, percent=12.5)], NOW)[0]["current_profit"] == 25.0
+
+
+def test_profit_never_decreases(vectorize):
+    # already credited more than the elapsed share, e.g. after a plan's duration was extended
+    assert server.accrue_batch([investment(10, 300.0, current=150.0)], [plan(30)], NOW) == []
+    assert server.accrue_batch([investment(10, 300.0, current=100.0)], [plan(30)], NOW) == []
+
+
+def test_rows_without_a_term_are_skipped(vectorize):
+    assert server.accrue_batch([investment(10, 300.0), investment(10, 300.0)], [None, plan(None)], NOW) == []
+
+
+def test_numpy_matches_loop(monkeypatch):
+    pytest.importorskip("numpy")
+    rng = random.Random(7)
+    rows, plans = [], []
+    for i in range(2000):
+        row = investment(rng.uniform(-5, 90), round(rng.uniform(1, 5000), 2), current=round(rng.uniform(0, 50), 2),
+                         amount=round(rng.uniform(10, 20000), 2))
+        row["id"] = str(i)
+        rows.append(row)
+        plans.append(None if i % 17 == 0 else plan(rng.choice([30, 45, 60]), rng.choice([5, 12.5, 30])))
+
+    monkeypatch.setattr(server, "ACCRUAL_VECTORIZE", False)
+    looped = server.accrue_batch(rows, plans, NOW)
+    monkeypatch.setattr(server, "ACCRUAL_VECTORIZE", True)
+    assert server.accrue_batch(rows, plans, NOW) == looped
+
+
+def test_apply_accrual_skips_rows_no_longer_active():
+    storage = server.MemoryStorage()
+
+    async def run():
+        active, cancelled = await storage.insert("user_investments", [
+            {"amount": 100, "profit_target": 10, "status": "active"},
+            {"amount": 100, "profit_target": 10, "status": "active"},
+        ])
+        await storage.update("user_investments", [("id", f"eq.{cancelled['id']}")], {"status": "cancelled"})
+        applied = await storage.apply_accrual([
+            {"id": active["id"], "current_profit": 10.0, "status": "completed"},
+            {"id": cancelled["id"], "current_profit": 10.0, "status": "completed"},
+        ])
+        rows = {row["id"]: row for row in await storage.select("user_investments")}
+        return applied, rows[active["id"]], rows[cancelled["id"]]
+
+    applied, active, cancelled = asyncio.run(run())
+    assert applied == {"updated": 1, "completed": 1}
+    assert (active["current_profit"], active["status"]) == (10.0, "completed")
+    assert (cancelled["current_profit"], cancelled["status"]) == (0, "cancelled")
@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+
+
+def test_app_can_start_and_stop_twice_in_one_process():
+    # each TestClient block runs the lifespan on a new event loop
+    for _ in range(2):
+        with TestClient(server.app) as client:
+            assert client.get("/api/health").status_code == 200
@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def test_withdrawal_above_balance_clamps_total_at_zero():
+    storage = server.MemoryStorage()
+
+    async def run():
+        user = (await storage.insert("users", [{"email": "u@example.com", "total_invested": 50}]))[0]
+        rows = await storage.insert("transactions", [
+            {"user_id": user["id"], "type": "withdrawal", "crypto_type": "BTC", "amount": 1, "usd_value": 80, "status": "pending"},
+            {"user_id": user["id"], "type": "deposit", "crypto_type": "BTC", "amount": 1, "usd_value": 20, "status": "pending"},
+        ])
+        decided = await storage.decide_transactions([rows[0]["id"]], "approved", None)
+        after_withdrawal = (await storage.select("users", [("id", f"eq.{user['id']}")]))[0]["total_invested"]
+        await storage.decide_transactions([rows[1]["id"]], "approved", None)
+        after_deposit = (await storage.select("users", [("id", f"eq.{user['id']}")]))[0]["total_invested"]
+        return len(decided), after_withdrawal, after_deposit
+
+    assert asyncio.run(run()) == (1, 0.0, 20.0)
@@ -0,0 +1,1097 @@
+#!/usr/bin/env python3
+"""
+Backend benchmarks for CryptoBoost
+Runs backend/server.py against a local stand-in for Supabase (GoTrue + PostgREST)
+and reports p50/p99 latency and requests/sec per scenario.
+
+Usage: python backend_bench.py [scenario ...] [--requests N] [--concurrency C]
+                               [--duration S] [--rate RPS] [--json out.json] [--compare old.json]
+
+`load` drives each endpoint in turn; --json writes every result (with the git commit) so runs can
+be compared: --compare exits non-zero when req/s drops or p95 grows by more than --threshold.
+`scaling` starts `uvicorn --workers N` subprocesses (N up to the core count) with and without the
+shared cache tier, served by a stand-in Redis, to show req/s and Supabase calls per request.
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+ANON_KEY = "bench-anon-key"
+
+
+# ============ Stand-in Supabase ============
+class SupabaseStub:
+    """In-memory GoTrue/PostgREST subset: eq filters, select projection, order, limit, insert."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        # fault injection, adjustable while running
+        self.error_rate = 0.0  # share of calls answered with 503
+        self.slow_rate = 0.0  # share of calls delayed by slow_ms
+        self.slow_ms = 0.0
+        self.calls: Dict[str, int] = {}
+        admin_role, client_role = str(uuid.uuid4()), str(uuid.uuid4())
+        self.tables: Dict[str, List[Dict[str, Any]]] = {
+            "roles": [{"id": admin_role, "name": "admin"}, {"id": client_role, "name": "client"}],
+            "users": [],
+            "investment_plans": [
+                {"id": str(uuid.uuid4()), "name": name, "min_amount": amount, "profit_target": pct,
+                 "duration_days": days, "is_active": True, "created_at": now_iso()}
+                for name, amount, pct, days in [("Starter", 50, 15, 30), ("Pro", 200, 25, 45), ("Expert", 500, 35, 60)]
+            ],
+            "user_investments": [],
+            "transactions": [],
+        }
+        self.tokens: Dict[str, Dict[str, Any]] = {}
+        self.app = self._build_app()
+
+    def add_user(self, email: str, role: str = "client") -> str:
+        user_id = str(uuid.uuid4())
+        role_id = next(r["id"] for r in self.tables["roles"] if r["name"] == role)
+        self.tables["users"].append({"id": user_id, "email": email, "role_id": role_id, "created_at": now_iso()})
+        token = f"token-{user_id}"
+        self.tokens[token] = {"id": user_id, "email": email}
+        return token
+
+    async def _respond(self, key: str) -> Optional[JSONResponse]:
+        """Count the call, apply latency and injected faults; a returned response short-circuits the handler."""
+        self.calls[key] = self.calls.get(key, 0) + 1
+        delay = self.latency
+        if self.slow_rate and random.random() < self.slow_rate:
+            delay += self.slow_ms / 1000.0
+        await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return JSONResponse({"message": "injected fault"}, status_code=503)
+        return None
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/auth/v1/user")
+        async def auth_user(request: Request):
+            fault = await self._respond("auth/user")
+            if fault:
+                return fault
+            token = request.headers.get("authorization", "").replace("Bearer ", "")
+            user = self.tokens.get(token)
+            if not user:
+                return JSONResponse({"msg": "invalid token"}, status_code=401)
+            return user
+
+        @app.post("/auth/v1/token")
+        async def auth_token(request: Request):
+            fault = await self._respond("auth/token")
+            if fault:
+                return fault
+            body = await request.json()
+            for token, user in self.tokens.items():
+                if user["email"] == body.get("email"):
+                    return {"access_token": token, "token_type": "bearer", "user": user}
+            return JSONResponse({"msg": "invalid login"}, status_code=400)
+
+        @app.post("/auth/v1/signup")
+        async def auth_signup(request: Request):
+            fault = await self._respond("auth/signup")
+            if fault:
+                return fault
+            body = await request.json()
+            user = {"id": str(uuid.uuid4()), "email": body["email"]}
+            self.tokens[f"token-{user['id']}"] = user
+            return {"user": user}
+
+        @app.post("/rest/v1/rpc/get_dashboard_stats")
+        async def rpc_dashboard_stats():
+            fault = await self._respond("rpc/get_dashboard_stats")
+            if fault:
+                return fault
+            t = self.tables
+            return {
+                "total_users": len(t["users"]),
+                "active_users": len(t["users"]),
+                "total_capital": sum(float(x.get("total_invested") or 0) for x in t["users"]),
+                "active_investments": sum(1 for x in t["user_investments"] if x.get("status", "active") == "active"),
+                "pending_transactions": sum(1 for x in t["transactions"] if x.get("status", "pending") == "pending"),
+                "total_profit": sum(float(x.get("total_profit") or 0) for x in t["users"]),
+                "monthly_growth": 0,
+                "weekly_growth": 0,
+            }
+
+        @app.post("/rest/v1/rpc/decide_transactions")
+        async def rpc_decide_transactions(request: Request):
+            fault = await self._respond("rpc/decide_transactions")
+            if fault:
+                return fault
+            body = await request.json()
+            ids, decision, note = set(body["transaction_ids"]), body["decision"], body.get("note")
+            decided = []
+            for row in self.tables["transactions"]:
+                if row["id"] in ids and row.get("status", "pending") == "pending":
+                    row.update(status=decision, updated_at=now_iso(), **({"admin_note": note} if note is not None else {}))
+                    decided.append(row)
+            users = {user["id"]: user for user in self.tables["users"]}
+            for row in decided:
+                if decision == "approved" and row["user_id"] in users:
+                    sign = 1 if row["type"] == "deposit" else -1
+                    users[row["user_id"]]["total_invested"] = max(float(users[row["user_id"]].get("total_invested") or 0) + sign * row["usd_value"], 0.0)
+                self.tables.setdefault("notifications", []).append(
+                    {"id": str(uuid.uuid4()), "user_id": row["user_id"], "title": f"{row['type']} {decision}", "created_at": now_iso()}
+                )
+            return decided
+
+        @app.post("/rest/v1/rpc/apply_accrual")
+        async def rpc_apply_accrual(request: Request):
+            fault = await self._respond("rpc/apply_accrual")
+            if fault:
+                return fault
+            updates = {u["id"]: u for u in (await request.json())["updates"]}
+            applied = {"updated": 0, "completed": 0}
+            for row in self.tables["user_investments"]:
+                update = updates.get(row["id"])
+                if update is not None and row.get("status", "active") == "active":
+                    row.update(current_profit=update["current_profit"], status=update["status"])
+                    applied["updated"] += 1
+                    applied["completed"] += update["status"] == "completed"
+            return applied
+
+        @app.get("/rest/v1/{table}")
+        async def rest_select(table: str, request: Request):
+            fault = await self._respond(table)
+            if fault:
+                return fault
+            rows = self._filter(table, request.query_params)
+            params = request.query_params
+            if "order" in params:
+                for term in reversed(params["order"].split(",")):
+                    col, _, direction = term.partition(".")
+                    rows = sorted(rows, key=lambda x: str(x.get(col)), reverse=direction.startswith("desc"))
+            if "limit" in params:
+                rows = rows[: int(params["limit"])]
+            return [self._project(row, params.get("select", "*")) for row in rows]
+
+        @app.post("/rest/v1/{table}")
+        async def rest_insert(table: str, request: Request):
+            fault = await self._respond(table)
+            if fault:
+                return fault
+            body = await request.json()
+            items = body if isinstance(body, list) else [body]
+            rows = self.tables.setdefault(table, [])
+            out = []
+            for item in items:
+                row = {"id": str(uuid.uuid4()), "created_at": now_iso(), **item}
+                rows.append(row)
+                out.append(row)
+            return JSONResponse(out, status_code=201)
+
+        @app.patch("/rest/v1/{table}")
+        async def rest_update(table: str, request: Request):
+            fault = await self._respond(table)
+            if fault:
+                return fault
+            values = await request.json()
+            rows = self._filter(table, request.query_params)
+            for row in rows:
+                row.update(values, updated_at=now_iso())
+            return rows
+
+        return app
+
+    def _filter(self, table: str, params: Any) -> List[Dict[str, Any]]:
+        rows = self.tables.get(table, [])
+        for key, value in params.multi_items():
+            if key in ("select", "order", "limit", "offset"):
+                continue
+            if key in ("or", "and"):
+                expr = parse_logic(f"{key}{value}")
+                rows = [r for r in rows if eval_logic(expr, r)]
+            else:
+                rows = [r for r in rows if match_op(r.get(key), value)]
+        return rows
+
+    def _project(self, row: Dict[str, Any], select: str) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for col in select.split(","):
+            if col == "*":
+                out.update(row)
+            elif ":" in col:
+                # embedded join, e.g. plan:investment_plans(name)
+                alias, _, rest = col.partition(":")
+                target, _, cols = rest.partition("(")
+                ref = next((p for p in self.tables.get(target, []) if p["id"] == row.get("plan_id")), None)
+                out[alias] = {c: ref.get(c) for c in cols.rstrip(")").split(",")} if ref else None
+            elif col in row:
+                out[col] = row[col]
+        return out
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def match_op(value: Any, expr: str) -> bool:
+    """Evaluate a PostgREST `op.operand` filter against a row value (string comparison)."""
+    op, _, operand = expr.partition(".")
+    operand = operand.strip('"')
+    left = "" if value is None else str(value)
+    if op == "eq":
+        return left == operand
+    if op == "neq":
+        return left != operand
+    if op == "in":
+        return left in [v.strip('"') for v in operand.strip("()").split(",")]
+    if op == "is":
+        return value is None if operand == "null" else str(value).lower() == operand
+    compare = {"gt": left > operand, "gte": left >= operand, "lt": left < operand, "lte": left <= operand}
+    return compare.get(op, True)
+
+
+def parse_logic(text: str) -> Any:
+    """Parse `or(a.eq.1,and(b.lt.2,c.gt.3))` into nested (op, [terms]) tuples."""
+    op, _, rest = text.partition("(")
+    terms, depth, start, body = [], 0, 0, rest[:-1]
+    for i, ch in enumerate(body + ","):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0 and body[start:i].count('"') % 2 == 0:
+            term = body[start:i]
+            terms.append(parse_logic(term) if term.startswith(("or(", "and(")) else tuple(term.split(".", 1)))
+            start = i + 1
+    return op, terms
+
+
+def eval_logic(expr: Any, row: Dict[str, Any]) -> bool:
+    op, terms = expr
+    results = (eval_logic(t, row) if t[0] in ("or", "and") and isinstance(t[1], list) else match_op(row.get(t[0]), t[1]) for t in terms)
+    return any(results) if op == "or" else all(results)
+
+
+# ============ Harness ============
+# ============ Stand-in Redis ============
+class RedisStub:
+    """RESP2 subset for the shared cache tier: GET/SET PX NX/DEL/SCAN MATCH/PUBLISH/SUBSCRIBE/PING."""
+
+    def __init__(self) -> None:
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.channels: Dict[bytes, List[asyncio.StreamWriter]] = {}
+        self.calls: Dict[str, int] = {}
+        self.port = free_port()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def __enter__(self) -> "RedisStub":
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(asyncio.start_server(self._serve, "127.0.0.1", self.port), self.loop).result()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(RedisStub.encode(v) for v in value)
+        if isinstance(value, str):
+            return f"+{value}\r\n".encode()
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0] if entry else None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:])):
+                    size = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self.encode(self._command(args, writer)))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            for subscribers in self.channels.values():
+                if writer in subscribers:
+                    subscribers.remove(writer)
+            writer.close()
+
+    def _command(self, args: List[bytes], writer: asyncio.StreamWriter) -> Any:
+        name = args[0].decode().upper()
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if name == "GET":
+            return self._get(args[1])
+        if name == "SET":
+            opts = [a.decode().upper() for a in args[3:]]
+            if "NX" in opts and self._get(args[1]) is not None:
+                return None
+            expires = time.monotonic() + int(args[3 + opts.index("PX") + 1]) / 1000.0 if "PX" in opts else None
+            self.data[args[1]] = (args[2], expires)
+            return "OK"
+        if name == "DEL":
+            return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        if name == "SCAN":
+            opts = [a.decode().upper() for a in args]
+            pattern = args[opts.index("MATCH") + 1].decode() if "MATCH" in opts else "*"
+            keys = [k for k in list(self.data) if fnmatch.fnmatchcase(k.decode(), pattern) and self._get(k) is not None]
+            return [b"0", keys]
+        if name == "PUBLISH":
+            subscribers = self.channels.get(args[1], [])
+            for subscriber in subscribers:
+                subscriber.write(self.encode([b"message", args[1], args[2]]))
+            return len(subscribers)
+        if name == "SUBSCRIBE":
+            for channel in args[1:]:
+                self.channels.setdefault(channel, []).append(writer)
+            # one reply per channel; all but the last are written here, the last is returned
+            for channel in args[1:-1]:
+                writer.write(self.encode([b"subscribe", channel, 1]))
+            return [b"subscribe", args[-1], 1]
+        if name == "PING":
+            return "PONG"
+        return "OK"  # CLIENT SETINFO, SELECT and the like
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerThread:
+    """Runs an ASGI app with uvicorn on its own event loop in a daemon thread."""
+
+    def __init__(self, app: Any):
+        self.port = free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "ServerThread":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def load_backend(supabase_url: str) -> Any:
+    os.environ["SUPABASE_URL"] = supabase_url
+    os.environ["SUPABASE_ANON_KEY"] = ANON_KEY
+    os.environ.pop("MONGO_URL", None)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")  # measure throughput, not the throttle
+    sys.path.insert(0, BACKEND_DIR)
+    import server
+
+    return server
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    latencies.sort()
+
+    def pct(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
+
+
+async def drive(
+    call: Callable[[], Awaitable[Any]],
+    requests: int,
+    concurrency: int,
+    duration: Optional[float] = None,
+    rate: Optional[float] = None,
+) -> Dict[str, float]:
+    """Run `call` `requests` times (or for `duration` seconds) from `concurrency` workers, back to back.
+
+    With `rate` (calls/sec) calls start on a fixed schedule instead, at most `concurrency` in flight, and
+    latency counts from the scheduled start so a stalled server shows up as latency, not as a lower rate.
+    """
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+
+    async def timed(t0: float) -> None:
+        nonlocal errors
+        try:
+            await call()
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    if rate:
+        slots = asyncio.Semaphore(concurrency)
+        total = int(duration * rate) if duration else requests
+
+        async def scheduled(due: float) -> None:
+            async with slots:
+                await timed(due)
+
+        tasks = []
+        for i in range(total):
+            due = started + i / rate
+            if due > time.perf_counter():
+                await asyncio.sleep(due - time.perf_counter())
+            tasks.append(asyncio.ensure_future(scheduled(due)))
+        await asyncio.gather(*tasks)
+    else:
+        remaining = iter(range(requests))
+
+        async def worker() -> None:
+            if deadline:
+                while time.perf_counter() < deadline:
+                    await timed(time.perf_counter())
+            else:
+                for _ in remaining:
+                    await timed(time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def time_op(fn: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    """Synchronous counterpart of drive() for CPU-bound micro-benchmarks."""
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+def report(title: str, results: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{'=' * 20} {title} {'=' * 20}")
+    print(f"{'variant':<32}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'upstream/req':>14}")
+    for name, r in results.items():
+        upstream = f"{r['upstream_per_request']:>14.2f}" if "upstream_per_request" in r else ""
+        print(
+            f"{name:<32}{r['rps']:>10.1f}{r['p50_ms']:>10.2f}{r.get('p95_ms', 0):>10.2f}{r['p99_ms']:>10.2f}"
+            f"{r['errors']:>8.0f}{upstream}"
+        )
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> int:
+    """Print throughput / p95 change per variant against a previous --json run; returns the regression count."""
+    regressions = 0
+    print(f"\n{'=' * 20} vs {baseline['meta'].get('commit') or 'baseline'} {'=' * 20}")
+    knobs = ("requests", "concurrency", "duration", "rate", "upstream_latency_ms")
+    changed = [k for k in knobs if baseline["meta"]["args"].get(k) != current["meta"]["args"].get(k)]
+    if changed:
+        print(f"warning: load settings differ from the baseline ({', '.join(changed)}); numbers are not comparable")
+    print(f"{'variant':<44}{'req/s':>10}{'p95 ms':>10}")
+    for scenario, variants in current["results"].items():
+        for name, r in variants.items():
+            base = baseline["results"].get(scenario, {}).get(name)
+            if not base or not base.get("rps") or not base.get("p95_ms"):
+                continue
+            rps = r["rps"] / base["rps"] - 1
+            p95 = r["p95_ms"] / base["p95_ms"] - 1
+            regressed = rps < -threshold or p95 > threshold
+            regressions += regressed
+            print(f"{scenario + ' ' + name:<44}{rps:>+10.1%}{p95:>+10.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+# ============ Scenarios ============
+async def bench_pool(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Profile lookup (auth/user + users select) with a fresh client per call vs the shared pool."""
+    server, stub_url, token = ctx["server"], ctx["stub_url"], ctx["token"]
+    user_id = token.replace("token-", "")
+    auth_url = f"{stub_url}/auth/v1/user"
+    users_url = f"{stub_url}/rest/v1/users?select=id,email,role_id&id=eq.{user_id}"
+
+    async def per_request_client() -> None:
+        async with httpx.AsyncClient(timeout=15.0) as client:
+            (await client.get(auth_url, headers=server.sb_headers(bearer=token, json=False))).raise_for_status()
+        async with httpx.AsyncClient(timeout=15.0) as client:
+            (await client.get(users_url, headers=server.sb_headers())).raise_for_status()
+
+    async def pooled_client() -> None:
+        (await server.sb_request("GET", auth_url, kind="auth", headers=server.sb_headers(bearer=token, json=False))).raise_for_status()
+        (await server.sb_request("GET", users_url, headers=server.sb_headers())).raise_for_status()
+
+    # the API thread owns the module-level client; use a fresh one bound to this loop
+    saved, server._http_client = server._http_client, None
+    try:
+        return {
+            "per-request AsyncClient": await drive(per_request_client, requests, concurrency),
+            "shared pooled client": await drive(pooled_client, requests, concurrency),
+        }
+    finally:
+        await server.close_http_client()
+        server._http_client = saved
+
+
+async def bench_api(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """End-to-end requests through server.py served by uvicorn."""
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    results: Dict[str, Dict[str, float]] = {}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=30.0) as client:
+        for path in ["/api/plans", "/api/me", "/api/user/my-investments", "/api/user/my-transactions"]:
+            async def call(path: str = path) -> None:
+                (await client.get(path, headers=headers)).raise_for_status()
+
+            results[path] = await drive(call, requests, concurrency)
+    return results
+
+
+async def bench_catalog(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """GET /api/plans with the response cache disabled, enabled, and revalidated via If-None-Match."""
+    server, stub = ctx["server"], ctx["stub"]
+    cache = server.plans_response_cache._cache
+    results: Dict[str, Dict[str, float]] = {}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=30.0) as client:
+        async def call(headers: Optional[Dict[str, str]] = None) -> None:
+            r = await client.get("/api/plans", headers=headers)
+            if r.status_code not in (200, 304):
+                r.raise_for_status()
+
+        ttl, cache.ttl = cache.ttl, 0.0
+        server.plans_response_cache.invalidate()
+        before = stub.calls.get("investment_plans", 0)
+        results["no cache"] = await drive(call, requests, concurrency)
+        cache.ttl = ttl
+        results["cached 200"] = await drive(call, requests, concurrency)
+        etag = (await client.get("/api/plans")).headers["etag"]
+        results["cached 304 (If-None-Match)"] = await drive(lambda: call({"If-None-Match": etag}), requests, concurrency)
+    print(f"investment_plans upstream calls: {stub.calls.get('investment_plans', 0) - before}")
+    return results
+
+
+async def bench_bulk(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Import `requests` transactions one POST at a time vs a single /bulk call."""
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    item = {"type": "deposit", "crypto_type": "BTC", "amount": 0.01, "usd_value": 500}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=120.0) as client:
+        async def single() -> None:
+            (await client.post("/api/user/transactions", json=item, headers=headers)).raise_for_status()
+
+        async def bulk() -> None:
+            r = await client.post("/api/user/transactions/bulk", json=[item] * requests, headers=headers)
+            r.raise_for_status()
+            assert r.json()["created"] == requests
+
+        sequential = await drive(single, requests, 1)
+        batched = await drive(bulk, 1, 1)
+    # report both as rows/sec so they are comparable
+    batched["rps"] *= requests
+    return {"sequential POST (rows/s)": sequential, "bulk endpoint (rows/s)": batched}
+
+
+async def bench_serialize(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Per-endpoint encode/decode of 100-row payloads: untyped dict + jsonable_encoder vs typed models + orjson."""
+    import json
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+
+    server = ctx["server"]
+    user_id, plan_id = str(uuid.uuid4()), str(uuid.uuid4())
+    samples = {
+        "plans": (server.PlanCreate, server.Plan, {
+            "name": "Pro", "description": "Balanced", "min_amount": 200, "max_amount": 5000, "profit_target": 25,
+            "duration_days": 45, "features": ["daily payouts"], "is_active": True,
+        }),
+        "investments": (server.InvestmentCreate, server.Investment, {
+            "plan_id": plan_id, "amount": 1500.5, "profit_target": 375.12,
+        }),
+        "transactions": (server.TransactionCreate, server.Transaction, {
+            "type": "deposit", "crypto_type": "BTC", "amount": 0.01234567, "usd_value": 789.1,
+            "wallet_address": "bc1qexample", "transaction_hash": "0xabc",
+        }),
+    }
+    results: Dict[str, Dict[str, float]] = {}
+    for name, (create_model, row_model, body) in samples.items():
+        request_body = json.dumps([body] * 100).encode()
+        stored = [{**body, "id": str(uuid.uuid4()), "user_id": user_id, "created_at": now_iso()} for _ in range(100)]
+        create_adapter, row_adapter = TypeAdapter(List[create_model]), TypeAdapter(List[row_model])
+        typed_rows = row_adapter.validate_python(stored)
+
+        results[f"{name} decode dict"] = time_op(lambda: json.loads(request_body), requests)
+        results[f"{name} decode typed"] = time_op(lambda: create_adapter.validate_json(request_body), requests)
+        results[f"{name} encode dict"] = time_op(lambda: JSONResponse(jsonable_encoder(stored)).body, requests)
+        results[f"{name} encode typed"] = time_op(
+            lambda: server.DefaultJSONResponse(row_adapter.dump_python(typed_rows, mode="json")).body, requests
+        )
+    return results
+
+
+async def bench_dashboard(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Client dashboard load: four separate API calls vs the aggregated /api/user/dashboard."""
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=30.0) as client:
+        async def separate() -> None:
+            for path in ["/api/me", "/api/user/my-investments", "/api/user/my-transactions", "/api/plans"]:
+                (await client.get(path, headers=headers)).raise_for_status()
+
+        async def aggregated() -> None:
+            (await client.get("/api/user/dashboard", headers=headers)).raise_for_status()
+
+        return {
+            "4 separate calls": await drive(separate, requests, concurrency),
+            "/api/user/dashboard": await drive(aggregated, requests, concurrency),
+        }
+
+
+async def bench_resilience(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Fault injection: slow upstream tail (hedging), flaky upstream (retries) and outage (breaker fast-fail)."""
+    server, stub = ctx["server"], ctx["stub"]
+    cache = server.plans_response_cache._cache
+    results: Dict[str, Dict[str, float]] = {}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=30.0) as client:
+        async def plans(expect: tuple = (200,)) -> None:
+            r = await client.get("/api/plans")
+            if r.status_code not in expect:
+                raise RuntimeError(r.status_code)
+
+        ttl, cache.ttl = cache.ttl, 0.0
+        stub.slow_rate, stub.slow_ms = 0.05, 300
+        results["5% slow (300ms), hedged"] = await drive(plans, requests, concurrency)
+        server.SUPABASE_HEDGING = False
+        results["5% slow (300ms), no hedge"] = await drive(plans, requests, concurrency)
+        server.SUPABASE_HEDGING = True
+        stub.slow_rate = 0.0
+        stub.error_rate = 0.2
+        results["20% 503s, retried"] = await drive(plans, requests, concurrency)
+        stub.error_rate = 1.0
+        results["outage (502/503 fast-fail)"] = await drive(lambda: plans((502, 503)), requests, concurrency)
+        stub.error_rate = 0.0
+        cache.ttl = ttl
+    print(f"breakers: {server.breakers['rest'].stats()}  retries spent: {server.retry_budget.spent}  hedges: {server.hedges_sent}")
+    for breaker in server.breakers.values():  # don't leave the outage open for later scenarios
+        breaker.record(True)
+    return results
+
+
+async def bench_storage(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Read endpoints with STORAGE_BACKEND=supabase (stub over HTTP) vs the in-memory engine, same rows."""
+    server, stub = ctx["server"], ctx["stub"]
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    memory = server.MemoryStorage()
+    memory.tables.clear()
+    memory.indexes.clear()
+    for table, rows in stub.tables.items():
+        await memory.insert(table, [dict(row) for row in rows])
+    results: Dict[str, Dict[str, float]] = {}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=30.0) as client:
+        for backend in (server.storage, memory):
+            saved, server.storage = server.storage, backend
+            try:
+                for path in ["/api/user/my-transactions", "/api/user/dashboard"]:
+                    async def call(path: str = path) -> None:
+                        (await client.get(path, headers=headers)).raise_for_status()
+
+                    results[f"{backend.name} {path.rsplit('/', 1)[-1]}"] = await drive(call, requests, concurrency)
+            finally:
+                server.storage = saved
+    return results
+
+
+async def bench_accrual(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Profit accrual over --accrual-rows active investments: per-row loop vs numpy, then a full memory-storage pass."""
+    server = ctx["server"]
+    count = ctx.get("accrual_rows") or 1_000_000
+    now = datetime.now(timezone.utc)
+    rng = random.Random(7)
+    starts = [(now - timedelta(days=d)).isoformat() for d in range(-5, 90)]
+    rows = [
+        {"id": str(uuid.UUID(int=i)), "created_at": starts[i % len(starts)], "start_date": starts[i % len(starts)],
+         "amount": 1000, "profit_target": round(rng.uniform(10, 500), 2), "current_profit": 0, "status": "active"}
+        for i in range(count)
+    ]
+    plans = [{"profit_target": 50, "duration_days": 30 if i % 3 else 60} for i in range(count)]
+    results: Dict[str, Dict[str, float]] = {}
+    saved = server.ACCRUAL_VECTORIZE
+    try:
+        server.ACCRUAL_VECTORIZE = False
+        results["per-row loop (rows/s)"] = time_op(lambda: server.accrue_batch(rows, plans, now), 1)
+    finally:
+        server.ACCRUAL_VECTORIZE = saved
+    if saved:
+        results["numpy vectorized (rows/s)"] = time_op(lambda: server.accrue_batch(rows, plans, now), 1)
+
+    memory = server.MemoryStorage()
+    plan = (await memory.insert("investment_plans", [{"name": "Bench", "min_amount": 1, "profit_target": 25, "duration_days": 45}]))[0]
+    await memory.insert("user_investments", [{**row, "plan_id": plan["id"]} for row in rows])
+    saved_storage, server.storage = server.storage, memory
+    server.plan_catalog.upsert([plan])
+    try:
+        t0 = time.perf_counter()
+        summary = await server.profit_accrual.run_once(now)
+        results["run_once, memory storage (rows/s)"] = summarize([(time.perf_counter() - t0) * 1000], 0, time.perf_counter() - t0)
+    finally:
+        server.storage = saved_storage
+    print(f"accrual pass: {summary}")
+    for stats in results.values():
+        stats["rps"] *= count
+    return results
+
+
+async def bench_prices(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """GET /api/prices from the in-memory table, concurrent refreshes against a slow source, server-priced POSTs."""
+    server = ctx["server"]
+    feed = server.price_feed
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    path = os.path.join(tempfile.mkdtemp(), "prices.json")
+    with open(path, "w") as f:
+        json.dump({"BTC": 61234.56, "ETH": 2345.67, "USDT": 0.92, "USDC": 0.92}, f)
+
+    class SlowSource(server.FilePriceSource):
+        fetches = 0
+
+        async def fetch(self) -> Dict[str, Any]:
+            SlowSource.fetches += 1
+            await asyncio.sleep(0.05)
+            return await super().fetch()
+
+    saved = feed.source
+    feed.source = SlowSource(path)
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        await feed.refresh()
+        results["price_feed.current() in-process"] = await drive(feed.current, requests, concurrency)
+        async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=30.0) as client:
+            async def get(headers: Optional[Dict[str, str]] = None) -> None:
+                r = await client.get("/api/prices", headers=headers)
+                if r.status_code not in (200, 304):
+                    r.raise_for_status()
+
+            results["GET /api/prices 200"] = await drive(get, requests, concurrency)
+            etag = (await client.get("/api/prices")).headers["etag"]
+            results["GET /api/prices 304"] = await drive(lambda: get({"If-None-Match": etag}), requests, concurrency)
+            item = {"type": "deposit", "crypto_type": "BTC", "amount": 0.01}
+
+            async def post() -> None:
+                (await client.post("/api/user/transactions", json=item, headers=headers)).raise_for_status()
+
+            results["POST /api/user/transactions (priced)"] = await drive(post, min(requests, 500), concurrency)
+        SlowSource.fetches = 0
+        results["concurrent refresh()"] = await drive(feed.refresh, concurrency, concurrency)
+        print(f"price source fetches for {concurrency} concurrent refreshes: {SlowSource.fetches}")
+    finally:
+        feed.source = saved
+    return results
+
+
+async def bench_load(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Per-endpoint load honouring --duration / --rate, with Supabase calls per request from the stub's counters."""
+    stub = ctx["stub"]
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    plan_id = stub.tables["investment_plans"][0]["id"]
+    endpoints: List[Tuple[str, str, Optional[Dict[str, Any]]]] = [
+        ("GET", "/api/health", None),
+        ("GET", "/api/roles", None),
+        ("GET", "/api/plans", None),
+        ("GET", "/api/me", None),
+        ("GET", "/api/user/my-investments", None),
+        ("GET", "/api/user/my-transactions", None),
+        ("GET", "/api/user/dashboard", None),
+        ("POST", "/api/user/transactions", {"type": "deposit", "crypto_type": "BTC", "amount": 0.01, "usd_value": 500}),
+        ("POST", "/api/user/investments", {"plan_id": plan_id, "amount": 100, "profit_target": 25}),
+    ]
+    results: Dict[str, Dict[str, float]] = {}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=30.0) as client:
+        for method, path, body in endpoints:
+            async def call(method: str = method, path: str = path, body: Optional[Dict[str, Any]] = body) -> None:
+                (await client.request(method, path, json=body, headers=headers)).raise_for_status()
+
+            before = sum(stub.calls.values())
+            stats = await drive(call, requests, concurrency, duration=ctx.get("duration"), rate=ctx.get("rate"))
+            stats["upstream_calls"] = sum(stub.calls.values()) - before
+            stats["upstream_per_request"] = stats["upstream_calls"] / stats["requests"] if stats["requests"] else 0.0
+            results[f"{method} {path}"] = stats
+    return results
+
+
+class BackendProcess:
+    """server.py under `uvicorn --workers N` in a subprocess, pointed at the stub; env entries override."""
+
+    def __init__(self, ctx: Dict[str, Any], workers: int = 1, env: Optional[Dict[str, str]] = None):
+        self.port = free_port()
+        self.workers = workers
+        self.env = {**os.environ, "SUPABASE_URL": ctx["stub_url"], "SUPABASE_ANON_KEY": ANON_KEY, "RATE_LIMIT_ENABLED": "0"}
+        self.env.pop("CACHE_URL", None)
+        self.env.update(env or {})
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "BackendProcess":
+        self.started = time.perf_counter()
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(self.port), "--workers", str(self.workers),
+             "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.env,
+        )
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.proc.terminate()
+        self.proc.wait(timeout=15)
+
+    async def wait_ready(self, client: httpx.AsyncClient, timeout: float = 60.0) -> float:
+        """Poll /api/ready; returns seconds from spawn to the first 200."""
+        while True:
+            try:
+                if (await client.get("/api/ready")).status_code == 200:
+                    return time.perf_counter() - self.started
+            except httpx.TransportError:
+                pass
+            if time.perf_counter() - self.started > timeout:
+                raise RuntimeError(f"backend on port {self.port} not ready after {timeout}s")
+            await asyncio.sleep(0.01)
+
+
+async def bench_scaling(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """GET /api/me on `uvicorn --workers N` subprocesses, in-process caches only vs a shared L2 (stand-in Redis)."""
+    stub = ctx["stub"]
+    tokens = [stub.add_user(f"scaling{i}@cryptoboost.world") for i in range(50)]
+    counts = sorted({1, 2, *(n for n in (4, 8, 16) if n <= (os.cpu_count() or 1))})
+    tiers = ["L1"]
+    if ctx["server"].REDIS_AVAILABLE:
+        tiers.append("L1+L2")
+    else:
+        print("redis package not installed: shared-tier variants skipped")
+    results: Dict[str, Dict[str, float]] = {}
+    with RedisStub() as redis_stub:
+        for tier in tiers:
+            for workers in counts:
+                env = {}
+                if tier == "L1+L2":
+                    env["CACHE_URL"] = redis_stub.url
+                    redis_stub.data.clear()
+                with BackendProcess(ctx, workers, env) as backend:
+                    async with httpx.AsyncClient(base_url=backend.url, timeout=30.0) as client:
+                        await backend.wait_ready(client)
+                        await asyncio.sleep(1.0)  # let the remaining workers finish their startup loads
+
+                        async def call() -> None:
+                            headers = {"Authorization": f"Bearer {random.choice(tokens)}"}
+                            (await client.get("/api/me", headers=headers)).raise_for_status()
+
+                        before = sum(stub.calls.values())
+                        stats = await drive(call, requests, concurrency, duration=ctx.get("duration"), rate=ctx.get("rate"))
+                        stats["upstream_calls"] = sum(stub.calls.values()) - before
+                        stats["upstream_per_request"] = stats["upstream_calls"] / stats["requests"] if stats["requests"] else 0.0
+                        results[f"{tier}, {workers} worker(s)"] = stats
+    return results
+
+
+async def bench_startup(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Cold start, --startup-runs times: `import server`, spawn to /api/ready 200, then the first requests."""
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    samples: Dict[str, List[float]] = {
+        "import server": [], "spawn -> /api/ready 200": [], "first GET /api/me": [], "first GET /api/plans": [],
+    }
+    for _ in range(ctx.get("startup_runs") or 5):
+        probe = "import time; t = time.perf_counter(); import server; print((time.perf_counter() - t) * 1000)"
+        out = subprocess.run([sys.executable, "-c", probe], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+        samples["import server"].append(float(out.stdout.split()[-1]))
+        with BackendProcess(ctx) as backend:
+            async with httpx.AsyncClient(base_url=backend.url, timeout=30.0) as client:
+                samples["spawn -> /api/ready 200"].append(await backend.wait_ready(client) * 1000)
+                for path in ("/api/me", "/api/plans"):
+                    t0 = time.perf_counter()
+                    (await client.get(path, headers=headers)).raise_for_status()
+                    samples[f"first GET {path}"].append((time.perf_counter() - t0) * 1000)
+    return {name: summarize(values, 0, sum(values) / 1000) for name, values in samples.items()}
+
+
+async def bench_review(ctx: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Admin review of pending transactions: walking the queue, then one decide call per row vs one per batch."""
+    server, stub = ctx["server"], ctx["stub"]
+    count = min(requests, server.REVIEW_MAX_IDS)
+    headers = {"Authorization": f"Bearer {stub.add_user('review-admin@cryptoboost.world', role='admin')}"}
+    owners = [stub.tokens[stub.add_user(f"review{i}@cryptoboost.world")]["id"] for i in range(20)]
+
+    def seed() -> List[str]:
+        rows = [
+            {"id": str(uuid.uuid4()), "user_id": owners[i % len(owners)], "type": "withdrawal" if i % 4 == 0 else "deposit",
+             "crypto_type": "BTC", "amount": 0.01, "usd_value": 500, "status": "pending", "created_at": now_iso()}
+            for i in range(count)
+        ]
+        stub.tables["transactions"].extend(rows)
+        return [row["id"] for row in rows]
+
+    results: Dict[str, Dict[str, float]] = {}
+    async with httpx.AsyncClient(base_url=ctx["api_url"], timeout=120.0) as client:
+        async def decide(ids: List[str]) -> None:
+            r = await client.post("/api/admin/transactions/decide", json={"ids": ids, "decision": "approved"}, headers=headers)
+            r.raise_for_status()
+            assert r.json()["decided"] == len(ids)
+
+        async def walk() -> None:
+            cursor: Optional[str] = None
+            while True:
+                r = await client.get("/api/admin/transactions/pending", params={"limit": 100, **({"cursor": cursor} if cursor else {})}, headers=headers)
+                r.raise_for_status()
+                cursor = r.headers.get("x-next-cursor")
+                if not cursor:
+                    return
+
+        async def one_by_one(ids: List[str]) -> Dict[str, float]:
+            pending = iter(ids)
+            return await drive(lambda: decide([next(pending)]), len(ids), concurrency)
+
+        async def batched(ids: List[str]) -> Dict[str, float]:
+            stats = await drive(lambda: decide(ids), 1, 1)
+            stats["rps"] *= len(ids)
+            return stats
+
+        async def queue(ids: List[str]) -> Dict[str, float]:
+            stats = await drive(walk, 1, 1)
+            stats["rps"] *= len(ids)
+            return stats
+
+        variants: List[Tuple[str, Callable[[List[str]], Awaitable[Dict[str, float]]]]] = [
+            ("GET pending, 100 per page (rows/s)", queue),
+            ("decide one id per call (rows/s)", one_by_one),
+            ("decide one batch call (rows/s)", batched),
+        ]
+        for name, run in variants:
+            ids = seed()
+            before = sum(stub.calls.values())
+            stats = await run(ids)
+            stats["upstream_calls"] = sum(stub.calls.values()) - before
+            stats["upstream_per_request"] = stats["upstream_calls"] / count
+            results[name] = stats
+            stub.tables["transactions"] = [row for row in stub.tables["transactions"] if row.get("status") != "pending"]
+    return results
+
+
+SCENARIOS: Dict[str, Callable[..., Awaitable[Dict[str, Dict[str, float]]]]] = {
+    "pool": bench_pool,
+    "api": bench_api,
+    "catalog": bench_catalog,
+    "bulk": bench_bulk,
+    "serialize": bench_serialize,
+    "dashboard": bench_dashboard,
+    "resilience": bench_resilience,
+    "storage": bench_storage,
+    "load": bench_load,
+    "accrual": bench_accrual,
+    "prices": bench_prices,
+    "scaling": bench_scaling,
+    "startup": bench_startup,
+    "review": bench_review,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, help="seconds per variant instead of --requests (load scenario)")
+    parser.add_argument("--rate", type=float, help="open-loop target req/s per variant (load scenario)")
+    parser.add_argument("--upstream-latency-ms", type=float, default=2.0)
+    parser.add_argument("--accrual-rows", type=int, default=1_000_000, help="investments in the accrual scenario")
+    parser.add_argument("--startup-runs", type=int, default=5, help="cold starts in the startup scenario")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="previous --json output to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    upstream: Dict[str, Dict[str, int]] = {}
+    stub = SupabaseStub(latency_ms=args.upstream_latency_ms)
+    with ServerThread(stub.app) as stub_server:
+        server = load_backend(stub_server.url)
+        token = stub.add_user("bench@cryptoboost.world")
+        with ServerThread(server.app) as api_server:
+            ctx = {
+                "server": server, "stub_url": stub_server.url, "api_url": api_server.url, "token": token, "stub": stub,
+                "duration": args.duration, "rate": args.rate, "accrual_rows": args.accrual_rows,
+                "startup_runs": args.startup_runs,
+            }
+            for name in args.scenarios:
+                before = dict(stub.calls)
+                results[name] = asyncio.run(SCENARIOS[name](ctx, args.requests, args.concurrency))
+                upstream[name] = {k: v - before.get(k, 0) for k, v in stub.calls.items() if v != before.get(k, 0)}
+                report(name, results[name])
+    print(f"\nUpstream calls: {stub.calls}")
+
+    run = {"meta": run_meta(args), "results": results, "upstream_calls": upstream}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(run, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            return 1 if compare(json.load(f), run, args.threshold) else 0
+    return 0
+
+
+def run_meta(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(BACKEND_DIR)
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": now_iso(),
+        "python": platform.python_version(),
+        "args": vars(args),
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(main())
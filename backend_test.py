@@ -77,7 +77,7 @@ class CryptoBoostAPITester:
         )
         if success:
             # Validate response structure
-            required_fields = ["status", "backend_time", "mongo"]
+            required_fields = ["status", "backend_time", "storage"]
             for field in required_fields:
                 if field not in response:
                     print(f"⚠️  Warning: Missing field '{field}' in health response")
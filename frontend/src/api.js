@@ -2,6 +2,18 @@ import axios from 'axios';
 
 const BASE_URL = process.env.REACT_APP_BACKEND_URL; // must include '/api'
 
+// List endpoints are keyset-paginated: follow X-Next-Cursor until the last page.
+const allPages = async (path, token) => {
+  const rows = [];
+  let cursor;
+  do {
+    const r = await axios.get(`${BASE_URL}${path}`, { headers: { Authorization: `Bearer ${token}` }, params: { limit: 1000, cursor } });
+    rows.push(...r.data);
+    cursor = r.headers['x-next-cursor'];
+  } while (cursor);
+  return rows;
+};
+
 export const api = {
   // auth
   register: (email, password, full_name) => axios.post(`${BASE_URL}/auth/register`, { email, password, full_name }).then(r => r.data),
@@ -17,7 +29,7 @@ export const api = {
 
   // user
   createInvestment: (token, data) => axios.post(`${BASE_URL}/user/investments`, data, { headers: { Authorization: `Bearer ${token}` } }).then(r => r.data),
-  myInvestments: (token) => axios.get(`${BASE_URL}/user/my-investments`, { headers: { Authorization: `Bearer ${token}` } }).then(r => r.data),
+  myInvestments: (token) => allPages('/user/my-investments', token),
   createTransaction: (token, data) => axios.post(`${BASE_URL}/user/transactions`, data, { headers: { Authorization: `Bearer ${token}` } }).then(r => r.data),
-  myTransactions: (token) => axios.get(`${BASE_URL}/user/my-transactions`, { headers: { Authorization: `Bearer ${token}` } }).then(r => r.data),
+  myTransactions: (token) => allPages('/user/my-transactions', token),
 };
\ No newline at end of file
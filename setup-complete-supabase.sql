@@ -157,6 +157,7 @@ CREATE INDEX IF NOT EXISTS idx_user_investments_user_id ON user_investments(user
 CREATE INDEX IF NOT EXISTS idx_user_investments_status ON user_investments(status);
 CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions(user_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions(status);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_created ON transactions(status, created_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions(type);
 CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications(user_id);
 CREATE INDEX IF NOT EXISTS idx_notifications_is_read ON notifications(is_read);
@@ -310,6 +311,79 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+-- Create function to apply a profit accrual pass ([{"id", "current_profit", "status"}, ...]) in one statement.
+-- Only current_profit and status are written, and only on rows that are still active, so a concurrent
+-- cancel or edit is never overwritten; profit only moves up, to at most profit_target and at most what
+-- the plan pays on the amount; returns {updated, completed}
+-- (runs with the caller's rights, so RLS applies as for a PATCH)
+DROP FUNCTION IF EXISTS apply_accrual(JSONB);
+CREATE OR REPLACE FUNCTION apply_accrual(updates JSONB)
+RETURNS JSONB AS $$
+  WITH applied AS (
+    UPDATE user_investments AS t
+    SET current_profit = LEAST(
+          GREATEST(COALESCE(t.current_profit, 0), u.current_profit),
+          t.profit_target,
+          TRUNC(t.amount * p.profit_target / 100, 2)
+        ),
+        status = CASE WHEN u.status = 'completed' THEN 'completed' ELSE t.status END
+    FROM jsonb_to_recordset(updates) AS u(id UUID, current_profit NUMERIC, status TEXT), investment_plans AS p
+    WHERE t.id = u.id AND t.status = 'active' AND p.id = t.plan_id
+    RETURNING t.status
+  )
+  SELECT jsonb_build_object(
+    'updated', COUNT(*),
+    'completed', COUNT(*) FILTER (WHERE status = 'completed')
+  )
+  FROM applied;
+$$ LANGUAGE sql;
+
+-- Create function to decide pending transactions in one statement: set their status, add approved
+-- deposits (subtract approved withdrawals, never below 0) to users.total_invested and notify each owner. Only rows
+-- still pending are decided, so a retry never applies a balance twice; returns the decided rows
+-- (runs with the caller's rights, so RLS applies: the API calls it with the admin's token)
+CREATE OR REPLACE FUNCTION decide_transactions(transaction_ids UUID[], decision TEXT, note TEXT DEFAULT NULL)
+RETURNS SETOF transactions AS $$
+BEGIN
+  IF decision NOT IN ('approved', 'rejected') THEN
+    RAISE EXCEPTION 'decision must be approved or rejected' USING ERRCODE = '22023';
+  END IF;
+  RETURN QUERY
+  WITH decided AS (
+    UPDATE transactions
+    SET status = decision, admin_note = COALESCE(note, admin_note), updated_at = NOW()
+    WHERE id = ANY(transaction_ids) AND status = 'pending'
+    RETURNING *
+  ), balances AS (
+    UPDATE users AS u
+    SET total_invested = GREATEST(COALESCE(u.total_invested, 0) + d.delta, 0), updated_at = NOW()
+    FROM (
+      SELECT user_id, SUM(CASE WHEN type = 'deposit' THEN usd_value ELSE -usd_value END) AS delta
+      FROM decided
+      WHERE status = 'approved'
+      GROUP BY user_id
+    ) AS d
+    WHERE u.id = d.user_id AND d.delta <> 0
+  ), notified AS (
+    -- texts mirror REVIEW_NOTIFICATIONS in backend/storage.py
+    INSERT INTO notifications (user_id, title, message, type)
+    SELECT d.user_id,
+           t.title,
+           format(t.message, trim_scale(d.amount), d.crypto_type, to_char(d.usd_value, 'FM999999999990.00'))
+             || COALESCE(' Note : ' || NULLIF(note, ''), ''),
+           t.kind
+    FROM decided AS d
+    JOIN (VALUES
+      ('deposit', 'approved', 'Dépôt approuvé', 'Votre dépôt de %s %s (%s €) a été validé.', 'success'),
+      ('deposit', 'rejected', 'Dépôt refusé', 'Votre dépôt de %s %s a été refusé.', 'error'),
+      ('withdrawal', 'approved', 'Retrait approuvé', 'Votre retrait de %s %s (%s €) a été validé.', 'success'),
+      ('withdrawal', 'rejected', 'Retrait refusé', 'Votre retrait de %s %s a été refusé.', 'error')
+    ) AS t(type, status, title, message, kind) ON t.type = d.type AND t.status = d.status
+  )
+  SELECT * FROM decided;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ===============================================
 -- 7. PERMISSIONS
 -- ===============================================
@@ -319,6 +393,9 @@ GRANT USAGE ON SCHEMA public TO anon, authenticated;
 GRANT ALL ON ALL TABLES IN SCHEMA public TO anon, authenticated;
 GRANT ALL ON ALL SEQUENCES IN SCHEMA public TO anon, authenticated;
 GRANT EXECUTE ON FUNCTION get_dashboard_stats() TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_accrual(JSONB) TO anon, authenticated;
+REVOKE EXECUTE ON FUNCTION decide_transactions(UUID[], TEXT, TEXT) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION decide_transactions(UUID[], TEXT, TEXT) TO authenticated;
 
 -- ===============================================
 -- 8. CONFIGURATION AUTHENTIFICATION (Désactiver confirmations email)